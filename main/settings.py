@@ -131,12 +131,67 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'server.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
 }
 
+API_PAGE_SIZE = int(os.environ.get("API_PAGE_SIZE", default=100))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'astramarin',
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get("CACHE_MAX_ENTRIES", default=100000))},
+    }
+}
+
+if os.environ.get("REDIS_URL"):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get("REDIS_URL"),
+    }
+
+REFERENCE_CACHE_TIMEOUT = int(os.environ.get("REFERENCE_CACHE_TIMEOUT", default=24 * 60 * 60))
+
+AUTH_TOKEN_MAX_AGE = int(os.environ.get("AUTH_TOKEN_MAX_AGE", default=12 * 60 * 60))
+
+# Без общего кэша (REDIS_URL) отзыв токена доходит до других процессов не позже этого срока.
+AUTH_TOKEN_GENERATION_TIMEOUT = int(os.environ.get("AUTH_TOKEN_GENERATION_TIMEOUT", default=60))
+
+# django.contrib.sessions.backends.cache или cached_db убирают чтение django_session из каждого запроса.
+SESSION_ENGINE = os.environ.get("SESSION_ENGINE", default="django.contrib.sessions.backends.db")
+
+SHIFT_CACHE_TIMEOUT = int(os.environ.get("SHIFT_CACHE_TIMEOUT", default=60))
+
+# Индекс посадки держится в кэше только при общем для всех процессов кэше, иначе билеты проверяются по базе.
+GATE_INDEX_ENABLED = bool(os.environ.get("REDIS_URL"))
+
+GATE_INDEX_TIMEOUT = int(os.environ.get("GATE_INDEX_TIMEOUT", default=24 * 60 * 60))
+
+GATE_FLUSH_SIZE = int(os.environ.get("GATE_FLUSH_SIZE", default=50))
+
+GATE_FLUSH_SECONDS = float(os.environ.get("GATE_FLUSH_SECONDS", default=2))
+
+RECEIPT_LAYOUT_VERSION = 1
+
+RECEIPT_CACHE_DIR = os.path.join(MEDIA_ROOT, 'tickets', 'check')
+
+RECEIPT_CACHE_MEMORY_BYTES = int(os.environ.get("RECEIPT_CACHE_MEMORY_BYTES", default=32 * 1024 * 1024))
+
+RECEIPT_CACHE_DISK_FILES = int(os.environ.get("RECEIPT_CACHE_DISK_FILES", default=20000))
+
+RECEIPT_PREWARM = int(os.environ.get("RECEIPT_PREWARM", default=0))
+
+RECEIPT_FONT = os.environ.get("RECEIPT_FONT", default="arial.ttf")
+
+RECEIPT_RENDER_POOL = os.environ.get("RECEIPT_RENDER_POOL", default="thread")
+
+RECEIPT_RENDER_WORKERS = int(os.environ.get("RECEIPT_RENDER_WORKERS", default=2))
+
 CRONJOBS = [
-    ('0 0 * * *', 'server.cron.logout_users')
+    ('0 0 * * *', 'server.cron.logout_users'),
+    ('0 6 * * *', 'server.cron.warm_gate_index'),
 ]
 
 LOGGING = {
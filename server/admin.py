@@ -1,9 +1,10 @@
 from django.contrib import admin
 from django.core.exceptions import ValidationError
 from django import forms
+from .services import recalculate_ticket, delete_tickets
 from .models import (
     LandingPlaces, PointsSale, PriceTypes, Price, Tickets, User, Ship, ShipSchedule, Berths, SalesReport, EvotorUsers,
-    EvotorToken, Shops, EvotorOperator, Terminal, Product
+    EvotorToken, Shops, EvotorOperator, Terminal, Product, DepartureCapacity, SalesRollup
 )
 
 
@@ -35,9 +36,27 @@ class TicketsAdmin(admin.ModelAdmin):
         ("Данные билета", {'fields': ('area', 'ship')}),
         ("Даты", {'fields': ('ticket_day', 'created_at')}),
         ("Стоимость", {'fields': ('price_types', 'adult_quantity', 'child_quantity', 'total_amount')}),
-        ("Чек, QR и данные о чеке", {'fields': ('check_qr_text',)}),
+        ("Чек, QR и данные о чеке", {'fields': ('check_rendered_at', 'check_layout')}),
         ("Статусы", {'fields': ('ticket_verified', 'ticket_has_expired', 'bought', 'ticket_return')}),
     )
+    readonly_fields = ('check_rendered_at', 'check_layout')
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        previous_departure = (form.initial['ship'], form.initial['ticket_day']) if change else None
+        recalculate_ticket(form.instance, previous_departure)
+
+    def delete_model(self, request, obj):
+        delete_tickets(Tickets.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        delete_tickets(queryset)
+
+
+@admin.register(DepartureCapacity)
+class DepartureCapacityAdmin(admin.ModelAdmin):
+    list_display = ['schedule', 'ticket_day', 'capacity', 'sold']
+    list_filter = ['ticket_day']
 
 
 @admin.register(LandingPlaces)
@@ -92,6 +111,12 @@ class SalesReportAdmin(admin.ModelAdmin):
     list_display = ['id', 'operator', 'report_date', 'sales_date', 'total_amount_report']
 
 
+@admin.register(SalesRollup)
+class SalesRollupAdmin(admin.ModelAdmin):
+    list_display = ['period', 'period_start', 'operator', 'ship', 'area', 'tickets_count', 'total_amount']
+    list_filter = ['period', 'period_start']
+
+
 @admin.register(EvotorUsers)
 class TerminalAdmin(admin.ModelAdmin):
     list_display = ['id', 'userId', 'token']
@@ -0,0 +1,105 @@
+import hashlib
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from server.models import Tickets
+from server.utils import bump_version
+
+ANALYTICS_TIMEOUT = 60 * 60
+ANALYTICS_GROUPS = ('ship', 'schedule', 'berth', 'hour')
+SHIPS_VERSION_KEY = 'analytics:ships'
+
+
+def _day_key(day):
+    return f'analytics:day:{day.isoformat()}'
+
+
+def bump_analytics_days(days):
+    """После фиксации транзакции сбрасывает аналитику за дни, в которых изменились продажи."""
+    days = set(days)
+    transaction.on_commit(lambda: [bump_version(_day_key(day)) for day in days])
+
+
+def bump_analytics_ships():
+    bump_version(SHIPS_VERSION_KEY)
+
+
+def _range_version(date_from, date_to):
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    versions = cache.get_many([_day_key(day) for day in days] + [SHIPS_VERSION_KEY])
+    return hashlib.md5(repr(sorted(versions.items())).encode()).hexdigest()
+
+
+def _group_key(row, group):
+    if group == 'ship':
+        return row['ship__ship'], {'ship': row['ship__ship'], 'vessel_name': row['ship__ship__vessel_name']}
+    if group == 'berth':
+        return row['ship__berths'], {'berth': row['ship__berths'], 'berths': row['ship__berths__berths']}
+    if group == 'hour':
+        hour = row['ship__start_time'].hour
+        return hour, {'hour': hour}
+    return row['ship'], {
+        'schedule': row['ship'],
+        'vessel_name': row['ship__ship__vessel_name'],
+        'start_time': row['ship__start_time'],
+        'end_time': row['ship__end_time'],
+    }
+
+
+def departure_rows(date_from, date_to):
+    """Продажи по рейсам за каждый день одним GROUP BY по билетам с расписанием и судном."""
+    return Tickets.objects.filter(ticket_return=False, ticket_day__range=(date_from, date_to)).values(
+        'ticket_day', 'ship', 'ship__start_time', 'ship__end_time', 'ship__ship', 'ship__ship__vessel_name',
+        'ship__ship__restrictions', 'ship__berths', 'ship__berths__berths'
+    ).annotate(
+        tickets=Count('pk'),
+        adult_quantity=Sum('adult_quantity'),
+        child_quantity=Sum('child_quantity'),
+        revenue=Sum('total_amount'),
+    ).order_by()
+
+
+def compute_departure_analytics(date_from, date_to, group='schedule'):
+    """
+    Пассажиры, выручка и загрузка за период. Строки запроса соответствуют
+    отдельным рейсам, поэтому вместимость складывается по рейсам. Рейсы без
+    ограничения мест не входят в расчет загрузки.
+    """
+    results = {}
+    for row in departure_rows(date_from, date_to):
+        key, fields = _group_key(row, group)
+        result = results.setdefault(key, dict(
+            fields, departures=0, tickets=0, adult_quantity=0, child_quantity=0, passengers=0, revenue=0,
+            capacity=0, load_factor=None, _seated=0
+        ))
+        passengers = (row['adult_quantity'] or 0) + (row['child_quantity'] or 0)
+        result['departures'] += 1
+        result['tickets'] += row['tickets']
+        result['adult_quantity'] += row['adult_quantity'] or 0
+        result['child_quantity'] += row['child_quantity'] or 0
+        result['passengers'] += passengers
+        result['revenue'] += row['revenue'] or 0
+        if row['ship__ship__restrictions']:
+            result['capacity'] += row['ship__ship__restrictions']
+            result['_seated'] += passengers
+
+    for result in results.values():
+        seated = result.pop('_seated')
+        if result['capacity']:
+            result['load_factor'] = round(seated / result['capacity'], 4)
+    return [results[key] for key in sorted(results, key=lambda value: (value is None, value))]
+
+
+def get_departure_analytics(date_from, date_to, group='schedule'):
+    """
+    То же из кэша. Ключ включает версии всех дней периода и версию судов,
+    поэтому новая продажа за любой день периода дает новый ключ.
+    """
+    key = f'analytics:{group}:{date_from.isoformat()}:{date_to.isoformat()}:{_range_version(date_from, date_to)}'
+    results = cache.get(key)
+    if results is None:
+        results = compute_departure_analytics(date_from, date_to, group)
+        cache.set(key, results, ANALYTICS_TIMEOUT)
+    return results
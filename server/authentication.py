@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signing import BadSignature, SignatureExpired, TimestampSigner
+from django.db import transaction
+from django.db.models import F
+from rest_framework import authentication
+from rest_framework.exceptions import AuthenticationFailed
+from server.models import User
+
+TOKEN_SALT = 'server.authentication'
+# Порядок полей как в модели: так требует Model.from_db() для неполной строки.
+TOKEN_USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in ('id', 'user_type', 'is_superuser', 'is_staff', 'is_active')
+)
+
+
+def _generation_key(user_id):
+    return f'auth:generation:{user_id}'
+
+
+def token_generation(user_id):
+    """
+    Поколение токенов пользователя из базы через кэш. None, если пользователя
+    нет: такие токены не принимаются.
+    """
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = User.objects.filter(pk=user_id).values_list('token_generation', flat=True).first()
+        if generation is not None:
+            cache.set(key, generation, settings.AUTH_TOKEN_GENERATION_TIMEOUT)
+    return generation
+
+
+def forget_token_generation(user_id):
+    # Сразу и после фиксации: иначе параллельный запрос успеет закэшировать старое поколение.
+    key = _generation_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def revoke_auth_tokens(user):
+    """Отзывает все выданные пользователю токены."""
+    User.objects.filter(pk=user.pk).update(token_generation=F('token_generation') + 1)
+    # Иначе следующий save() этого экземпляра вернет в базу старое поколение.
+    user.refresh_from_db(fields=['token_generation'])
+    forget_token_generation(user.pk)
+
+
+def issue_auth_token(user, points_sale=None):
+    """Подписанный токен с ID пользователя, должностью и ID открытой смены."""
+    claims = {
+        'id': user.pk,
+        'user_type': user.user_type,
+        'is_superuser': user.is_superuser,
+        'is_staff': user.is_staff,
+        'is_active': user.is_active,
+        'shift': points_sale.pk if points_sale else None,
+        'gen': user.token_generation,
+    }
+    return TimestampSigner(salt=TOKEN_SALT).sign_object(claims, compress=True)
+
+
+def read_auth_token(token):
+    try:
+        return TimestampSigner(salt=TOKEN_SALT).unsign_object(token, max_age=settings.AUTH_TOKEN_MAX_AGE)
+    except SignatureExpired:
+        raise AuthenticationFailed('Срок действия токена истек.')
+    except BadSignature:
+        raise AuthenticationFailed('Недействительный токен.')
+
+
+class SignedTokenAuthentication(authentication.BaseAuthentication):
+    """
+    Заголовок "Authorization: Bearer <токен>". Подпись и срок проверяются без
+    обращения к базе, поколение токена читается из кэша: пользователь собирается
+    из данных токена, остальные поля User загружаются отложенно при первом
+    обращении. request.auth содержит данные токена. CSRF для таких запросов не
+    проверяется.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        header = authentication.get_authorization_header(request).split()
+        if not header or header[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(header) != 2:
+            raise AuthenticationFailed('Неверный заголовок авторизации.')
+        try:
+            claims = read_auth_token(header[1].decode())
+        except UnicodeError:
+            raise AuthenticationFailed('Недействительный токен.')
+        if not claims['is_active']:
+            raise AuthenticationFailed('Пользователь неактивен.')
+        if claims.get('gen') != token_generation(claims['id']):
+            raise AuthenticationFailed('Токен отозван.')
+        user = User.from_db('default', TOKEN_USER_FIELDS, [claims[field] for field in TOKEN_USER_FIELDS])
+        return user, claims
+
+    def authenticate_header(self, request):
+        return self.keyword
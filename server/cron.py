@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.utils import timezone
+from .gate_index import warm_day
 from .models import User, PointsSale
 
 
@@ -12,3 +13,7 @@ def logout_users():
         points_sale.left_at = timezone.now().date()
         points_sale.complete_the_work_day = True
         points_sale.save()
+
+
+def warm_gate_index():
+    warm_day()
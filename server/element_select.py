@@ -13,3 +13,8 @@ SHIFT_STATUS = (
     ('Открытая смена', 'Открытая смена'),
     ('Архив', 'Архив'),
 )
+
+ROLLUP_PERIOD = (
+    ('День', 'День'),
+    ('Месяц', 'Месяц'),
+)
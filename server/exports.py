@@ -0,0 +1,193 @@
+import csv
+import zipfile
+from datetime import date, datetime, time
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+from server.models import Tickets, SalesReport
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORTS = {
+    'tickets': (Tickets, 'ticket_day', (
+        ('id', 'ID'),
+        ('created_at', 'Дата продажи'),
+        ('ticket_day', 'День билета'),
+        ('operator__operator__username', 'Оператор'),
+        ('ship__ship__vessel_name', 'Судно'),
+        ('ship__start_time', 'Время отправления'),
+        ('area__address', 'Площадка'),
+        ('adult_quantity', 'Взрослых'),
+        ('child_quantity', 'Детей'),
+        ('total_amount', 'Сумма'),
+        ('ticket_verified', 'Проверен'),
+        ('ticket_return', 'Возврат'),
+    )),
+    'sales_reports': (SalesReport, 'report_date', (
+        ('id', 'ID'),
+        ('report_date', 'Дата отчета'),
+        ('operator__operator__username', 'Оператор'),
+        ('total_adult_quantity', 'Взрослых'),
+        ('total_child_quantity', 'Детей'),
+        ('total_amount_report', 'Сумма'),
+    )),
+}
+
+EXPORT_OUTPUTS = {
+    'csv': 'text/csv; charset=utf-8',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+
+def export_rows(name, date_from=None, date_to=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Заголовок и ленивый поток строк выгрузки. Строки читаются через values_list()
+    и iterator(), поэтому в памяти одновременно не больше chunk_size строк.
+    """
+    model, date_field, columns = EXPORTS[name]
+    queryset = model.objects.all()
+    if date_from:
+        queryset = queryset.filter(**{f'{date_field}__gte': date_from})
+    if date_to:
+        queryset = queryset.filter(**{f'{date_field}__lte': date_to})
+    fields = [field for field, _ in columns]
+    rows = queryset.order_by('pk').values_list(*fields).iterator(chunk_size=chunk_size)
+    return [title for _, title in columns], (tuple(map(_local, row)) for row in rows)
+
+
+def _local(value):
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None, microsecond=0)
+    return value
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_csv(header, rows):
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+class _ChunkBuffer:
+    """Файл без seek() для zipfile: записанное забирается генератором по частям."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _column_name(index):
+    name = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        name = chr(65 + remainder) + name
+    return name
+
+
+def _cell(reference, value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        return f'<c r="{reference}"><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        value = value.strftime('%Y-%m-%d %H:%M:%S')
+    elif isinstance(value, (date, time)):
+        value = value.isoformat()
+    return f'<c r="{reference}" t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _row(number, values):
+    cells = ''.join(_cell(f'{_column_name(index)}{number}', value) for index, value in enumerate(values))
+    return f'<row r="{number}">{cells}</row>'
+
+
+XLSX_PARTS = (
+    ('[Content_Types].xml', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    )),
+    ('_rels/.rels', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="xl/workbook.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+        '</Relationships>'
+    )),
+    ('xl/workbook.xml', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="{sheet}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+    )),
+    ('xl/_rels/workbook.xml.rels', (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        '</Relationships>'
+    )),
+)
+
+
+def stream_xlsx(header, rows, sheet='Лист1', rows_per_chunk=500):
+    """
+    Пишет XLSX потоком: zipfile работает с файлом без seek(), лист собирается
+    строками с inline-строками без sharedStrings, поэтому книга не держится в памяти.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in XLSX_PARTS:
+            archive.writestr(name, content.replace('{sheet}', escape(sheet)))
+        yield buffer.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as worksheet:
+            worksheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _row(1, header)
+            ).encode())
+            lines = []
+            for number, values in enumerate(rows, start=2):
+                lines.append(_row(number, values))
+                if len(lines) == rows_per_chunk:
+                    worksheet.write(''.join(lines).encode())
+                    lines = []
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            worksheet.write((''.join(lines) + '</sheetData></worksheet>').encode())
+    yield buffer.drain()
+
+
+def stream_export(name, output, date_from=None, date_to=None):
+    header, rows = export_rows(name, date_from, date_to)
+    if output == 'xlsx':
+        return stream_xlsx(header, rows)
+    return (line.encode() for line in stream_csv(header, rows))
@@ -0,0 +1,66 @@
+from functools import lru_cache
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+
+
+class ValuesSerializer:
+    """
+    Чтение списков через QuerySet.values(): поля ModelSerializer один раз
+    разворачиваются в пути values() и функции to_representation, строки
+    собираются в ту же форму JSON без экземпляров моделей и сериализаторов.
+    Поддерживаются простые поля, PrimaryKeyRelatedField и вложенные
+    сериализаторы по ForeignKey/OneToOne.
+    """
+
+    def __init__(self, serializer_class, fields=None, expand=None):
+        self.serializer_class = serializer_class
+        self.lookups = []
+        self.entries = self.compile(serializer_class(context={'sparse_fields': (fields, expand)}), '')
+
+    def compile(self, serializer, prefix):
+        entries = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            unreadable = (serializers.ManyRelatedField, serializers.SerializerMethodField)
+            if field.source == '*' or isinstance(field, unreadable):
+                raise ImproperlyConfigured(f'{self.serializer_class.__name__}.{name}: поле не читается через values().')
+            lookup = prefix + field.source.replace('.', '__')
+            self.lookups.append(lookup)
+            if isinstance(field, serializers.BaseSerializer):
+                if isinstance(field, serializers.ListSerializer):
+                    raise ImproperlyConfigured(f'{self.serializer_class.__name__}.{name}: many=True не поддерживается.')
+                entries.append((name, lookup, self.compile(field, lookup + '__')))
+            elif isinstance(field, serializers.PrimaryKeyRelatedField):
+                entries.append((name, lookup, None))
+            else:
+                entries.append((name, lookup, field.to_representation))
+        return entries
+
+    def build(self, entries, row):
+        data = {}
+        for name, lookup, mapper in entries:
+            value = row[lookup]
+            if value is None or mapper is None:
+                data[name] = value
+            elif isinstance(mapper, list):
+                data[name] = self.build(mapper, row)
+            else:
+                data[name] = mapper(value)
+        return data
+
+    def values(self, queryset, *extra):
+        """values() с путями сериализатора и дополнительными полями, например полями курсора."""
+        return queryset.values(*self.lookups, *[name for name in extra if name not in self.lookups])
+
+    def serialize(self, rows):
+        return [self.build(self.entries, row) for row in rows]
+
+    def data(self, queryset):
+        return self.serialize(self.values(queryset))
+
+
+@lru_cache(maxsize=256)
+def values_serializer(serializer_class, fields=None, expand=None):
+    return ValuesSerializer(serializer_class, fields, expand)
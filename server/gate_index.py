@@ -0,0 +1,201 @@
+import atexit
+import logging
+import threading
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils import timezone
+from server.manifest import mark_tickets_verified
+from server.models import Tickets
+
+logger = logging.getLogger(__name__)
+
+GateEntry = namedtuple('GateEntry', ('schedule_id', 'ticket_day', 'start_time', 'returned', 'verified'))
+
+ENTRY_FIELDS = ('pk', 'ship_id', 'ticket_day', 'ship__start_time', 'ticket_return', 'ticket_verified')
+
+
+def entry_key(ticket_id):
+    return f'gate:ticket:{ticket_id}'
+
+
+def used_key(ticket_id):
+    return f'gate:used:{ticket_id}'
+
+
+def departure_key(schedule_id, ticket_day):
+    return f'gate:departure:{schedule_id}:{ticket_day.isoformat()}'
+
+
+def _entry(row):
+    return GateEntry(
+        row['ship_id'], row['ticket_day'], row['ship__start_time'], row['ticket_return'], row['ticket_verified']
+    )
+
+
+def _timeout(ticket_day):
+    """Срок записи индекса: до конца дня рейса, но не дольше GATE_INDEX_TIMEOUT."""
+    day_end = timezone.make_aware(datetime.combine(ticket_day + timedelta(days=1), time.min))
+    return min(settings.GATE_INDEX_TIMEOUT, int((day_end - timezone.now()).total_seconds()))
+
+
+def _store(rows):
+    entries = {entry_key(row['pk']): _entry(row) for row in rows}
+    if settings.GATE_INDEX_ENABLED:
+        for ticket_day in {entry.ticket_day for entry in entries.values()}:
+            timeout = _timeout(ticket_day)
+            if timeout > 0:
+                day_entries = {key: entry for key, entry in entries.items() if entry.ticket_day == ticket_day}
+                cache.set_many(day_entries, timeout)
+    return entries
+
+
+def warm_departure(schedule_id, ticket_day):
+    """Загружает в индекс все билеты рейса на день одним запросом."""
+    if not settings.GATE_INDEX_ENABLED or _timeout(ticket_day) <= 0:
+        return 0
+    rows = Tickets.objects.filter(ship_id=schedule_id, ticket_day=ticket_day).values(*ENTRY_FIELDS)
+    entries = _store(rows)
+    cache.set(departure_key(schedule_id, ticket_day), len(entries), _timeout(ticket_day))
+    return len(entries)
+
+
+def warm_day(ticket_day=None):
+    """Прогревает индекс всех рейсов, на которые проданы билеты на день."""
+    ticket_day = ticket_day or timezone.localdate()
+    schedule_ids = Tickets.objects.filter(ticket_day=ticket_day).values_list('ship_id', flat=True).order_by().distinct()
+    return sum(warm_departure(schedule_id, ticket_day) for schedule_id in schedule_ids)
+
+
+def get_gate_entry(ticket_id):
+    """
+    Состояние билета для контроля на посадке. Берется из кэша, а при промахе
+    загружается из базы. Первый промах по сегодняшнему рейсу прогревает
+    индекс всего рейса. None, если билета нет.
+    """
+    entry = cache.get(entry_key(ticket_id)) if settings.GATE_INDEX_ENABLED else None
+    if entry is None:
+        row = Tickets.objects.filter(pk=ticket_id).values(*ENTRY_FIELDS).first()
+        if row is None:
+            return None
+        entry = _store([row])[entry_key(ticket_id)]
+        if (
+            settings.GATE_INDEX_ENABLED
+            and entry.ticket_day == timezone.localdate()
+            and cache.get(departure_key(entry.schedule_id, entry.ticket_day)) is None
+        ):
+            warm_departure(entry.schedule_id, entry.ticket_day)
+    return entry
+
+
+def get_gate_entries(ticket_ids):
+    """То же для пачки: промахи кэша дочитываются одним запросом с IN."""
+    keys = {entry_key(ticket_id): ticket_id for ticket_id in ticket_ids}
+    cached = cache.get_many(keys) if settings.GATE_INDEX_ENABLED else {}
+    entries = {keys[key]: entry for key, entry in cached.items()}
+    missing = [ticket_id for ticket_id in keys.values() if ticket_id not in entries]
+    if missing:
+        rows = Tickets.objects.filter(pk__in=missing).values(*ENTRY_FIELDS)
+        entries.update({keys[key]: entry for key, entry in _store(rows).items()})
+    return entries
+
+
+def index_tickets(tickets):
+    """После фиксации транзакции добавляет проданные билеты в индекс."""
+    rows = [{
+        'pk': ticket.pk,
+        'ship_id': ticket.ship_id,
+        'ticket_day': ticket.ticket_day,
+        'ship__start_time': ticket.ship.start_time,
+        'ticket_return': ticket.ticket_return,
+        'ticket_verified': ticket.ticket_verified,
+    } for ticket in tickets]
+    if settings.GATE_INDEX_ENABLED:
+        transaction.on_commit(lambda: _store(rows))
+
+
+def forget_ticket(ticket_id):
+    """Убирает билет из индекса после возврата или правки, следующий запрос перечитает его из базы."""
+    if settings.GATE_INDEX_ENABLED:
+        transaction.on_commit(lambda: cache.delete(entry_key(ticket_id)))
+
+
+def is_marked_used(ticket_id):
+    return settings.GATE_INDEX_ENABLED and cache.get(used_key(ticket_id)) is not None
+
+
+def remember_used(ticket_ids):
+    """Помечает в индексе билеты, проверенные без связи и уже записанные в базу."""
+    if not settings.GATE_INDEX_ENABLED:
+        return
+    cache.set_many({used_key(ticket_id): 1 for ticket_id in ticket_ids}, settings.GATE_INDEX_TIMEOUT)
+    cache.delete_many([entry_key(ticket_id) for ticket_id in ticket_ids])
+
+
+def claim_ticket(ticket_id):
+    """
+    Атомарно помечает билет использованным в кэше. False, если его уже
+    отсканировали. Без индекса решает UPDATE в mark_tickets_verified().
+    """
+    if not settings.GATE_INDEX_ENABLED:
+        return True
+    return cache.add(used_key(ticket_id), 1, settings.GATE_INDEX_TIMEOUT)
+
+
+def mark_used(ticket_id):
+    """
+    То же, что claim_ticket(), но запись в базу откладывается и выполняется
+    пачкой. Без индекса билет сразу отмечается в базе.
+    """
+    if not settings.GATE_INDEX_ENABLED:
+        return bool(mark_tickets_verified([ticket_id]))
+    if not claim_ticket(ticket_id):
+        return False
+    verification_buffer.add(ticket_id)
+    return True
+
+
+class VerificationBuffer:
+    """Копит ID проверенных билетов и пишет их одним UPDATE по размеру пачки или по времени."""
+
+    def __init__(self, size, interval):
+        self.size = size
+        self.interval = interval
+        self._ticket_ids = []
+        self._lock = threading.Lock()
+
+    def add(self, ticket_id):
+        with self._lock:
+            if not self._ticket_ids:
+                timer = threading.Timer(self.interval, self._flush_in_timer)
+                timer.daemon = True
+                timer.start()
+            self._ticket_ids.append(ticket_id)
+            due = len(self._ticket_ids) >= self.size
+        if due:
+            self.flush()
+
+    def _flush_in_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Не удалось записать проверенные билеты")
+        finally:
+            connections.close_all()
+
+    def flush(self):
+        with self._lock:
+            ticket_ids, self._ticket_ids = self._ticket_ids, []
+        if not ticket_ids:
+            return 0
+        updated = len(mark_tickets_verified(ticket_ids))
+        if updated != len(ticket_ids):
+            logger.warning(f"Проверено в кэше {len(ticket_ids)} билетов, записано в базу {updated}")
+        return updated
+
+
+verification_buffer = VerificationBuffer(settings.GATE_FLUSH_SIZE, settings.GATE_FLUSH_SECONDS)
+atexit.register(verification_buffer.flush)
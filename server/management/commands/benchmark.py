@@ -0,0 +1,320 @@
+import gzip
+import json
+import shutil
+import tempfile
+import time as timer
+from datetime import date, time, timedelta
+from decimal import Decimal
+import qrcode
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from server.analytics import departure_rows
+from server.authentication import issue_auth_token
+from server.fast_serializers import values_serializer
+from server.models import (
+    Tickets, PointsSale, User, ShipSchedule, Ship, Berths, LandingPlaces, SalesReport, EvotorToken, Price, PriceTypes
+)
+from server.serializers import ShipScheduleGetAllSerializer, PriceTypesPriceGETSerializer, LandingPlacesSerializer
+from server.receipts import ReceiptCache, ReceiptTemplate, render_qr, render_stored, render_thermal, RECEIPT_OUTPUTS
+from server.ticket_codes import encode_ticket_code
+
+
+def sample_ticket():
+    """Билет в памяти со всеми связями, чтобы замеры не зависели от базы."""
+    schedule = ShipSchedule(
+        pk=1,
+        ship=Ship(pk=1, vessel_name='Восход', restrictions=20),
+        berths=Berths(pk=1, berths='Центральный причал'),
+        start_time=time(12, 30),
+        end_time=time(13, 30),
+    )
+    return Tickets(
+        pk=123456,
+        operator=PointsSale(pk=1, operator=User(pk=1, username='operator')),
+        ship=schedule,
+        area=LandingPlaces(pk=1, address='Набережная'),
+        ticket_day=date.today(),
+        created_at=date.today(),
+        adult_quantity=2,
+        child_quantity=1,
+        total_amount=Decimal('1200.00'),
+        bought=True,
+    )
+
+
+INDEXES_MIGRATION = ('0009_sales_rollup', '0010_query_indexes')
+
+
+def seed_season(tickets_count, days=150, operators=20, schedules=12):
+    """
+    Заполняет базу сезоном продаж через bulk_create: смены и отчеты на каждый
+    день для каждого оператора, билеты равномерно по дням и рейсам.
+    Возвращает замеряемые запросы.
+    """
+    first_day = date.today() - timedelta(days=days - 1)
+    users = User.objects.bulk_create([
+        User(username=f'bench_operator_{index}', user_type='Оператор') for index in range(operators)
+    ])
+    ships = Ship.objects.bulk_create([Ship(vessel_name=f'Судно {index}', restrictions=50) for index in range(4)])
+    berths = Berths.objects.bulk_create([Berths(berths=f'Причал {index}') for index in range(3)])
+    area = LandingPlaces.objects.create(address='Набережная')
+    schedule_list = ShipSchedule.objects.bulk_create([
+        ShipSchedule(
+            ship=ships[index % len(ships)], berths=berths[index % len(berths)],
+            start_time=time(9 + index % 12, 0), end_time=time(9 + index % 12, 45)
+        )
+        for index in range(schedules)
+    ])
+    shifts = PointsSale.objects.bulk_create([
+        PointsSale(
+            operator=user,
+            create_data=first_day + timedelta(days=day),
+            status='Открытая смена' if day == days - 1 else 'Архив'
+        )
+        for day in range(days) for user in users
+    ], batch_size=2000)
+    SalesReport.objects.bulk_create([
+        SalesReport(operator=shift, report_date=shift.create_data) for shift in shifts
+    ], batch_size=2000)
+    EvotorToken.objects.bulk_create([
+        EvotorToken(userId=f'user-{index}', token=f'token-{index}') for index in range(2000)
+    ])
+    for start in range(0, tickets_count, 5000):
+        Tickets.objects.bulk_create([
+            Tickets(
+                operator=shifts[index % len(shifts)],
+                ship=schedule_list[index % len(schedule_list)],
+                area=area,
+                ticket_day=shifts[index % len(shifts)].create_data,
+                created_at=shifts[index % len(shifts)].create_data,
+                adult_quantity=2,
+                child_quantity=1,
+                total_amount=Decimal('1200.00'),
+                bought=True,
+            )
+            for index in range(start, min(start + 5000, tickets_count))
+        ])
+
+    user, schedule, shift = users[operators // 2], schedule_list[schedules // 2], shifts[-1]
+    day = shift.create_data
+    return {
+        'билеты оператора, страница': lambda: Tickets.objects.filter(
+            operator__operator=user).order_by('created_at', 'id')[:100],
+        'билеты рейса за день': lambda: Tickets.objects.filter(
+            ship=schedule, ticket_day=day).values_list('pk', flat=True),
+        'аналитика за месяц': lambda: departure_rows(day - timedelta(days=30), day),
+        'открытая смена оператора': lambda: PointsSale.objects.filter(
+            operator=shift.operator_id, create_data=day, status='Открытая смена')[:1],
+        'отчет смены': lambda: SalesReport.objects.filter(operator=shift, report_date=day)[:1],
+        'отчеты за месяц': lambda: SalesReport.objects.filter(
+            report_date__gte=day.replace(day=1)).order_by('report_date', 'id')[:100],
+        'токен Эвотор': lambda: EvotorToken.objects.filter(token='token-1500')[:1],
+    }
+
+
+def seed_lists(user, rows):
+    """Добавляет по rows строк во все списки оператора, каждая строка со своими связями."""
+    area = LandingPlaces.objects.create(address=f'Набережная {rows}')
+    ships = Ship.objects.bulk_create([Ship(vessel_name=f'Судно {rows}-{index}') for index in range(rows)])
+    berth = Berths.objects.create(berths=f'Причал {rows}')
+    schedules = ShipSchedule.objects.bulk_create([
+        ShipSchedule(ship=ship, berths=berth, start_time=time(10, 0), end_time=time(11, 0)) for ship in ships
+    ])
+    price_types = PriceTypes.objects.bulk_create([
+        PriceTypes(price=price, client_type=f'{rows}-{index}')
+        for index, price in enumerate(Price.objects.bulk_create([
+            Price(price=Decimal(rows * 1000 + index)) for index in range(rows)
+        ]))
+    ])
+    shifts = PointsSale.objects.bulk_create([PointsSale(operator=user) for _ in range(rows)])
+    PointsSale.landing_places.through.objects.bulk_create([
+        PointsSale.landing_places.through(pointssale=shift, landingplaces=area) for shift in shifts
+    ])
+    SalesReport.objects.bulk_create([SalesReport(operator=shift, report_date=shift.create_data) for shift in shifts])
+    tickets = Tickets.objects.bulk_create([
+        Tickets(operator=shift, ship=schedule, area=area, ticket_day=date.today(), adult_quantity=1)
+        for shift, schedule in zip(shifts, schedules)
+    ])
+    Tickets.price_types.through.objects.bulk_create([
+        Tickets.price_types.through(tickets=ticket, pricetypes=price_type)
+        for ticket, price_type in zip(tickets, price_types)
+    ])
+
+
+def legacy_qr(data, size):
+    """Прежний способ: box_size=50 и уменьшение до нужного размера."""
+    qr_code = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=50, border=2)
+    qr_code.add_data(data)
+    qr_code.make(fit=True)
+    qr_image = qr_code.make_image(fill_color="black", back_color="white")
+    return qr_image.get_image(), qr_image.resize((size, size))
+
+
+class Command(BaseCommand):
+    help = 'Замеры производительности горячих путей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('target', choices=['receipts', 'qr', 'queries', 'serializers', 'auth'])
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--tickets', type=int, default=150000, help='Билетов в тестовом сезоне для queries')
+        parser.add_argument('--rows', type=int, default=500, help='Строк в каждом справочнике для serializers')
+
+    def handle(self, *args, **options):
+        self.options = options
+        getattr(self, f"bench_{options['target']}")(options['iterations'])
+
+    def report(self, name, iterations, elapsed, rows=None):
+        line = f'{name:<40} {iterations / elapsed:10.1f} /с  {elapsed / iterations * 1000:8.2f} мс'
+        if rows:
+            line += f'  {iterations * rows / elapsed:12.0f} строк/с'
+        self.stdout.write(line)
+
+    def measure(self, name, iterations, func, rows=None):
+        func()
+        started = timer.perf_counter()
+        for _ in range(iterations):
+            func()
+        self.report(name, iterations, timer.perf_counter() - started, rows)
+
+    def bench_receipts(self, iterations):
+        ticket = sample_ticket()
+        template = ReceiptTemplate()
+        self.measure('чек: шаблон на каждый вызов', iterations, lambda: ReceiptTemplate().render(ticket))
+        self.measure('чек: шаблон воркера', iterations, lambda: template.render(ticket))
+        self.measure('чек: термопринтер 384 точки', iterations, lambda: render_thermal(ticket))
+
+        for output, (_, _, render) in RECEIPT_OUTPUTS.items():
+            data = render(ticket)
+            self.stdout.write(
+                f'{output}: {len(data)} байт, в кэше {len(render_stored(ticket, output))} байт, '
+                f'gzip {len(gzip.compress(data))} байт'
+            )
+
+        cache = ReceiptCache(tempfile.mkdtemp(), settings.RECEIPT_CACHE_MEMORY_BYTES, iterations)
+        rendered_at = timezone.now()
+        self.measure(
+            'чек: отрисовка и запись в кэш', iterations,
+            lambda: cache.set((ticket.pk, 'png', rendered_at), RECEIPT_OUTPUTS['png'][2](ticket))
+        )
+        self.measure('чек: попадание в кэш', iterations, lambda: cache.get((ticket.pk, 'png', rendered_at)))
+        shutil.rmtree(cache.directory, ignore_errors=True)
+
+    def bench_qr(self, iterations):
+        code = encode_ticket_code(sample_ticket())
+        size = ReceiptTemplate.qr_size
+        raw, _ = legacy_qr(code, size)
+        modules = raw.width // 50
+        box_size = size // modules
+        self.measure('QR: box_size=50 + resize', iterations, lambda: legacy_qr(code, size))
+        self.measure('QR: 1 бит под размер', iterations, lambda: render_qr(code, size))
+        # Оценка по размерам изображений, 1 байт на точку: буферы Pillow выделяются в C, tracemalloc их не видит.
+        self.stdout.write(
+            f'Промежуточный буфер на чек (оценка): {raw.width}x{raw.height} = {raw.width * raw.height // 1024} КБ '
+            f'против {modules}x{modules} + {modules * box_size}x{modules * box_size} = '
+            f'{(modules * modules + (modules * box_size) ** 2) // 1024} КБ'
+        )
+
+    def bench_queries(self, iterations):
+        """
+        Создает отдельную тестовую базу, откатывает миграцию индексов, заполняет
+        сезон данными и замеряет горячие запросы до и после индексов.
+        """
+        connection = connections['default']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            call_command('migrate', 'server', INDEXES_MIGRATION[0], verbosity=0)
+            queries = seed_season(self.options['tickets'])
+            self.stdout.write(f'Тестовая база: {connection.settings_dict["NAME"]}, билетов: {self.options["tickets"]}')
+            for title, migration in (('без индексов', INDEXES_MIGRATION[0]), ('с индексами', INDEXES_MIGRATION[1])):
+                call_command('migrate', 'server', migration, verbosity=0)
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n{title}'))
+                for name, query in queries.items():
+                    self.stdout.write(f'  план: {query().explain()}'.replace('\n', '\n        '))
+                    self.measure(name, iterations, lambda: list(query()))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def bench_serializers(self, iterations):
+        """
+        Сравнивает ModelSerializer и чтение через values() на справочниках,
+        которые постоянно опрашивают терминалы. JSON обоих путей должен совпадать.
+        """
+        connection = connections['default']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_lists(User.objects.create(username='bench_operator', user_type='Оператор'), self.options['rows'])
+            cases = (
+                (ShipScheduleGetAllSerializer, ShipSchedule.objects.select_related('ship').order_by('pk')),
+                (PriceTypesPriceGETSerializer, PriceTypes.objects.select_related('price').order_by('pk')),
+                (LandingPlacesSerializer, LandingPlaces.objects.order_by('pk')),
+            )
+            renderer = JSONRenderer()
+            for serializer_class, queryset in cases:
+                values = values_serializer(serializer_class)
+                expected = renderer.render(serializer_class(queryset.all(), many=True).data)
+                if renderer.render(values.data(queryset.all())) != expected:
+                    raise CommandError(f'{serializer_class.__name__}: JSON через values() отличается')
+                count = queryset.count()
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n{serializer_class.__name__}, строк: {count}'))
+                self.measure(
+                    'ModelSerializer', iterations, lambda: serializer_class(queryset.all(), many=True).data, count
+                )
+                self.measure('values()', iterations, lambda: values.data(queryset.all()), count)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def bench_auth(self, iterations):
+        """
+        Продажа билета через весь стек middleware: сессия в базе, сессия в кэше
+        и подписанный токен. Для каждого способа выводится число запросов к базе.
+        """
+        connection = connections['default']
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            user = User.objects.create_user('bench_operator', 'password', user_type='Оператор', is_active=True)
+            area = LandingPlaces.objects.create(address='Набережная', currently_working=True)
+            points_sale = PointsSale.objects.create(operator=user)
+            points_sale.landing_places.add(area)
+            schedule = ShipSchedule.objects.create(
+                ship=Ship.objects.create(vessel_name='Восход', restrictions=None),
+                start_time=time(23, 59), end_time=time(23, 59, 30)
+            )
+            price_types = [
+                PriceTypes.objects.create(client_type=client_type, price=Price.objects.create(price=price))
+                for client_type, price in (('Взрослый', 500), ('Ребенок', 200))
+            ]
+            body = json.dumps(dict(
+                ship=schedule.pk, area=area.pk, price_types=[price_type.pk for price_type in price_types],
+                ticket_day=str(timezone.now().date()), adult_quantity=1, child_quantity=0, bought=True
+            ))
+
+            def sell(client, **headers):
+                response = client.post('/ticket/create/', body, content_type='application/json', **headers)
+                if response.status_code != 201:
+                    raise CommandError(f'Продажа не прошла: {response.status_code} {response.content[:200]}')
+
+            cases = [
+                ('сессия в базе', 'django.contrib.sessions.backends.db', {}),
+                ('сессия в кэше', 'django.contrib.sessions.backends.cache', {}),
+                ('подписанный токен', 'django.contrib.sessions.backends.db', {
+                    'HTTP_AUTHORIZATION': f'Bearer {issue_auth_token(user, points_sale)}'
+                }),
+            ]
+            for name, engine, headers in cases:
+                # Client ходит с Host: testserver, как в тестах; без него запрос упадет с DisallowedHost.
+                with override_settings(SESSION_ENGINE=engine, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                    client = Client()
+                    if not headers:
+                        client.force_login(user)
+                    sell(client, **headers)
+                    with CaptureQueriesContext(connection) as queries:
+                        sell(client, **headers)
+                    self.measure(f'{name}, запросов: {len(queries)}', iterations, lambda: sell(client, **headers))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,34 @@
+import sys
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from server.exports import EXPORTS, EXPORT_OUTPUTS, stream_export
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError('Дата должна быть в формате ГГГГ-ММ-ДД')
+
+
+class Command(BaseCommand):
+    help = 'Выгружает билеты или отчеты о продажах в CSV/XLSX потоком, не загружая их в память'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=list(EXPORTS))
+        parser.add_argument('--output', choices=list(EXPORT_OUTPUTS), default='csv')
+        parser.add_argument('--date-from', type=parse_date, help='С даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--date-to', type=parse_date, help='По дату (ГГГГ-ММ-ДД)')
+        parser.add_argument('--file', help='Файл для записи, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        chunks = stream_export(options['name'], options['output'], options['date_from'], options['date_to'])
+        if options['file']:
+            with open(options['file'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Выгрузка сохранена в {options['file']}"))
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,30 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from server.models import Tickets, SalesRollup
+from server.services import aggregate_rollups, month_bounds
+
+
+class Command(BaseCommand):
+    help = 'Заполняет сводки продаж по дням и месяцам заново из билетов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Пересчитать только месяц (ГГГГ-ММ)')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        tickets = Tickets.objects.all()
+        rollups = SalesRollup.objects.all()
+        if options['month']:
+            try:
+                month_start, next_month = month_bounds(datetime.strptime(options['month'], '%Y-%m').date())
+            except ValueError:
+                raise CommandError('Месяц должен быть в формате ГГГГ-ММ')
+            tickets = tickets.filter(operator__create_data__gte=month_start, operator__create_data__lt=next_month)
+            rollups = rollups.filter(period_start__gte=month_start, period_start__lt=next_month)
+
+        deleted, _ = rollups.delete()
+        created = 0
+        for period in ('День', 'Месяц'):
+            created += len(SalesRollup.objects.bulk_create(aggregate_rollups(tickets, period), batch_size=1000))
+        self.stdout.write(self.style.SUCCESS(f'Удалено строк сводки: {deleted}, создано: {created}'))
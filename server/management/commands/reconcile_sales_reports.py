@@ -0,0 +1,64 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Sum
+from server.models import Tickets, SalesReport
+
+REPORT_FIELDS = ('total_adult_quantity', 'total_child_quantity', 'total_amount_report')
+
+
+class Command(BaseCommand):
+    help = 'Сверяет отчеты о продажах с билетами и при необходимости исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Сверить только смены за дату (ГГГГ-ММ-ДД)')
+        parser.add_argument('--fix', action='store_true', help='Записать пересчитанные значения в отчеты')
+
+    def handle(self, *args, **options):
+        tickets = Tickets.objects.filter(ticket_return=False)
+        reports = SalesReport.objects.filter(report_date=F('operator__create_data'))
+        if options['date']:
+            try:
+                shift_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Дата должна быть в формате ГГГГ-ММ-ДД')
+            tickets = tickets.filter(operator__create_data=shift_date)
+            reports = reports.filter(report_date=shift_date)
+
+        totals = {
+            row.pop('operator'): row
+            for row in tickets.values('operator', 'operator__create_data').annotate(
+                total_adult_quantity=Sum('adult_quantity'),
+                total_child_quantity=Sum('child_quantity'),
+                total_amount_report=Sum('total_amount'),
+            ).order_by()
+        }
+
+        drifted = []
+        for report in reports.iterator():
+            expected = totals.pop(report.operator_id, {})
+            changed = False
+            for field in REPORT_FIELDS:
+                value = expected.get(field) or 0
+                if (getattr(report, field) or 0) != value:
+                    self.stdout.write(
+                        f'Отчет {report.pk} (смена {report.operator_id}): {field} {getattr(report, field)} -> {value}'
+                    )
+                    setattr(report, field, value)
+                    changed = True
+            if changed:
+                drifted.append(report)
+        missing = []
+        for operator_id, expected in totals.items():
+            self.stdout.write(f'Смена {operator_id}: нет отчета о продажах')
+            missing.append(SalesReport(
+                operator_id=operator_id,
+                report_date=expected['operator__create_data'],
+                **{field: expected[field] or 0 for field in REPORT_FIELDS}
+            ))
+
+        if options['fix']:
+            SalesReport.objects.bulk_update(drifted, REPORT_FIELDS, batch_size=500)
+            SalesReport.objects.bulk_create(missing, batch_size=500)
+            self.stdout.write(self.style.SUCCESS(f'Исправлено отчетов: {len(drifted)}, создано: {len(missing)}'))
+        else:
+            self.stdout.write(f'Отчетов с расхождениями: {len(drifted)}, смен без отчета: {len(totals)}')
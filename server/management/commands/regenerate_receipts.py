@@ -0,0 +1,84 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from server.models import Tickets
+from server.receipts import create_process_pool, render_in_worker, RECEIPT_OUTPUTS
+
+
+class Command(BaseCommand):
+    help = 'Перерисовывает чеки билетов в кэш пулом процессов, например после смены логотипа или макета'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Только билеты на дату (ГГГГ-ММ-ДД)')
+        parser.add_argument('--departure', type=int, help='Только билеты рейса (ID расписания)')
+        parser.add_argument(
+            '--output', nargs='+', choices=list(RECEIPT_OUTPUTS), default=['png'], help='Форматы чеков'
+        )
+        parser.add_argument(
+            '--stale', action='store_true', help='Только чеки, которые еще не рисовались или нарисованы старым макетом'
+        )
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Количество процессов')
+        parser.add_argument('--batch-size', type=int, default=200, help='Билетов в одной задаче')
+
+    def handle(self, *args, **options):
+        queryset = Tickets.objects.all()
+        if options['date']:
+            try:
+                ticket_day = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Дата должна быть в формате ГГГГ-ММ-ДД')
+            queryset = queryset.filter(ticket_day=ticket_day)
+        if options['departure']:
+            queryset = queryset.filter(ship_id=options['departure'])
+        if options['stale']:
+            queryset = queryset.filter(
+                Q(check_rendered_at__isnull=True) | ~Q(check_layout=settings.RECEIPT_LAYOUT_VERSION)
+            )
+
+        total = queryset.count()
+        if not total:
+            self.stdout.write('Нет билетов для перерисовки')
+            return
+
+        batch_size = options['batch_size']
+        workers = max(options['workers'], 1)
+        outputs = tuple(options['output'])
+        ticket_ids = queryset.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=batch_size)
+        self.stdout.write(f'Билетов: {total}, процессов: {workers}, форматы: {", ".join(outputs)}')
+
+        rendered = processed = 0
+        started = time.perf_counter()
+        pending = {}
+        with create_process_pool(workers) as pool:
+            batch = []
+            for ticket_id in ticket_ids:
+                batch.append(ticket_id)
+                if len(batch) == batch_size:
+                    pending[pool.submit(render_in_worker, batch, outputs)] = len(batch)
+                    batch = []
+                    # Держим в очереди не больше двух пачек на процесс, чтобы не читать все ID в память.
+                    while len(pending) >= workers * 2:
+                        rendered, processed = self.collect(pending, rendered, processed, total, started)
+            if batch:
+                pending[pool.submit(render_in_worker, batch, outputs)] = len(batch)
+            while pending:
+                rendered, processed = self.collect(pending, rendered, processed, total, started)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Перерисовано чеков: {rendered}, ошибок: {processed - rendered}, '
+            f'за {elapsed:.1f} с ({rendered / elapsed:.1f} чеков/с)'
+        ))
+
+    def collect(self, pending, rendered, processed, total, started):
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            processed += pending.pop(future)
+            rendered += future.result()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{processed}/{total} ({processed * 100 // total}%), {rendered / elapsed:.1f} чеков/с')
+        return rendered, processed
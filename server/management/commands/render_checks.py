@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.db.models import Q
+from django.core.management.base import BaseCommand
+from server.models import Tickets
+from server.receipts import render_ticket_checks
+
+BATCH_SIZE = 100
+
+
+class Command(BaseCommand):
+    help = 'Заранее рисует в кэш чеки, которые еще не рисовались или устарели после смены макета'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ticket', type=int, nargs='*', help='ID билетов для повторного формирования')
+
+    def handle(self, *args, **options):
+        if options['ticket']:
+            queryset = Tickets.objects.filter(pk__in=options['ticket'])
+        else:
+            queryset = Tickets.objects.filter(
+                Q(check_rendered_at__isnull=True) | ~Q(check_layout=settings.RECEIPT_LAYOUT_VERSION)
+            )
+
+        ticket_ids = list(queryset.order_by('pk').values_list('pk', flat=True))
+        rendered = 0
+        for start in range(0, len(ticket_ids), BATCH_SIZE):
+            rendered += render_ticket_checks(ticket_ids[start:start + BATCH_SIZE])
+        self.stdout.write(self.style.SUCCESS(f'Сформировано чеков: {rendered}, ошибок: {len(ticket_ids) - rendered}'))
@@ -0,0 +1,135 @@
+import base64
+import struct
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from server.models import Tickets, DepartureCapacity, ShipSchedule
+
+
+def sold_seats(schedule_id, ticket_day):
+    """Места, занятые невозвращенными билетами рейса."""
+    return Tickets.objects.filter(ship_id=schedule_id, ticket_day=ticket_day, ticket_return=False).aggregate(
+        seats=Coalesce(Sum(Coalesce('adult_quantity', 0) + Coalesce('child_quantity', 0)), 0)
+    )['seats']
+
+
+def get_departure_ledger(schedule, ticket_day):
+    """
+    Строка учета рейса. Новая строка сразу получает места уже проданных
+    билетов, чтобы продажи до ее появления тоже учитывались во вместимости.
+    """
+    ledger, _ = DepartureCapacity.objects.get_or_create(
+        schedule=schedule,
+        ticket_day=ticket_day,
+        defaults={
+            'capacity': lambda: schedule.ship.restrictions,
+            'sold': lambda: sold_seats(schedule.pk, ticket_day),
+        }
+    )
+    return ledger
+
+
+def current_manifest_version(schedule_id, ticket_day):
+    return DepartureCapacity.objects.filter(
+        schedule_id=schedule_id, ticket_day=ticket_day
+    ).values_list('version', flat=True).first() or 0
+
+
+def bump_manifest_version(schedule_id, ticket_day):
+    """
+    Увеличивает версию манифеста рейса и возвращает новое значение.
+    Строка учета остается заблокированной до конца транзакции.
+    """
+    updated = DepartureCapacity.objects.filter(schedule_id=schedule_id, ticket_day=ticket_day).update(
+        version=F('version') + 1
+    )
+    if not updated:
+        get_departure_ledger(ShipSchedule.objects.select_related('ship').get(pk=schedule_id), ticket_day)
+        return bump_manifest_version(schedule_id, ticket_day)
+    return current_manifest_version(schedule_id, ticket_day)
+
+
+@transaction.atomic
+def rebuild_departure_ledger(schedule_id, ticket_day):
+    """
+    Пересчитывает занятые места рейса по билетам, например после правки или
+    удаления билета в админке. Возвращает новую версию манифеста рейса.
+    """
+    version = bump_manifest_version(schedule_id, ticket_day)
+    DepartureCapacity.objects.filter(schedule_id=schedule_id, ticket_day=ticket_day).update(
+        sold=sold_seats(schedule_id, ticket_day)
+    )
+    return version
+
+
+@transaction.atomic
+def mark_tickets_verified(ticket_ids):
+    """
+    Отмечает билеты использованными: по одному UPDATE на рейс, версия
+    манифеста рейса увеличивается. Возвращает множество отмеченных ID.
+    """
+    departures = {}
+    rows = Tickets.objects.select_for_update().filter(
+        pk__in=ticket_ids, ticket_verified=False, ticket_return=False
+    ).values_list('pk', 'ship_id', 'ticket_day').order_by()
+    for ticket_id, schedule_id, ticket_day in rows:
+        departures.setdefault((schedule_id, ticket_day), []).append(ticket_id)
+
+    verified = set()
+    for (schedule_id, ticket_day), departure_ticket_ids in sorted(departures.items()):
+        version = bump_manifest_version(schedule_id, ticket_day)
+        Tickets.objects.filter(pk__in=departure_ticket_ids).update(ticket_verified=True, manifest_version=version)
+        verified.update(departure_ticket_ids)
+    return verified
+
+
+def pack_ids(ticket_ids):
+    """Отсортированные ID как массив uint32 big-endian в base64."""
+    return base64.b64encode(struct.pack(f'>{len(ticket_ids)}I', *ticket_ids)).decode()
+
+
+def pack_bitmap(flags):
+    """Битовая карта в base64: бит i (старший бит байта первым) относится к i-му ID."""
+    bitmap = bytearray((len(flags) + 7) // 8)
+    for index, flag in enumerate(flags):
+        if flag:
+            bitmap[index // 8] |= 0x80 >> (index % 8)
+    return base64.b64encode(bytes(bitmap)).decode()
+
+
+def build_manifest(schedule, ticket_day, since=None):
+    """
+    Манифест рейса для проверки билетов без связи. При since возвращает только
+    билеты, изменившиеся после этой версии: новые и проверенные в ids/verified,
+    возвращенные в removed. Если since больше текущей версии, отдается полный манифест.
+    """
+    version = current_manifest_version(schedule.pk, ticket_day)
+    full = since is None or since > version
+    tickets = Tickets.objects.filter(ship=schedule, ticket_day=ticket_day)
+    if not full:
+        tickets = tickets.filter(manifest_version__gt=since)
+    else:
+        tickets = tickets.filter(ticket_return=False)
+
+    ticket_ids, verified, removed = [], [], []
+    rows = tickets.order_by('pk').values_list('pk', 'ticket_verified', 'ticket_return')
+    for ticket_id, ticket_verified, ticket_return in rows:
+        if ticket_return:
+            removed.append(ticket_id)
+        else:
+            ticket_ids.append(ticket_id)
+            verified.append(bool(ticket_verified))
+
+    return {
+        'ship': schedule.pk,
+        'ticket_day': ticket_day,
+        'start_time': schedule.start_time,
+        'version': version,
+        'since': None if full else since,
+        'full': full,
+        'count': len(ticket_ids),
+        'ids': pack_ids(ticket_ids),
+        'verified': pack_bitmap(verified),
+        'removed': pack_ids(removed),
+    }
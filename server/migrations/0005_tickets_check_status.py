@@ -0,0 +1,24 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:41
+
+from django.db import migrations, models
+
+
+def mark_rendered_checks(apps, schema_editor):
+    Tickets = apps.get_model('server', 'Tickets')
+    Tickets.objects.exclude(check_qr_text='').exclude(check_qr_text__isnull=True).update(check_status='Готов')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0004_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tickets',
+            name='check_status',
+            field=models.CharField(choices=[('В очереди', 'В очереди'), ('Готов', 'Готов'), ('Ошибка', 'Ошибка')], default='В очереди', max_length=9, verbose_name='Статус чека'),
+        ),
+        migrations.RunPython(mark_rendered_checks, migrations.RunPython.noop),
+    ]
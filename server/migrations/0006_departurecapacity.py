@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0005_tickets_check_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DepartureCapacity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ticket_day', models.DateField(verbose_name='День билета')),
+                ('capacity', models.PositiveIntegerField(blank=True, null=True, verbose_name='Вместимость')),
+                ('sold', models.PositiveIntegerField(default=0, verbose_name='Продано мест')),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='capacities', to='server.shipschedule', verbose_name='Время посадки')),
+            ],
+            options={
+                'verbose_name': 'Загрузка рейса',
+                'verbose_name_plural': 'Загрузка рейсов',
+                'unique_together': {('schedule', 'ticket_day')},
+            },
+        ),
+    ]
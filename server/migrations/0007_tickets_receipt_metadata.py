@@ -0,0 +1,31 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0006_departurecapacity'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='tickets',
+            name='check_qr_text',
+        ),
+        migrations.RemoveField(
+            model_name='tickets',
+            name='check_status',
+        ),
+        migrations.AddField(
+            model_name='tickets',
+            name='check_layout',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Версия макета чека'),
+        ),
+        migrations.AddField(
+            model_name='tickets',
+            name='check_rendered_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Чек нарисован'),
+        ),
+    ]
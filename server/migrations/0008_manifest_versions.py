@@ -0,0 +1,27 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0007_tickets_receipt_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='departurecapacity',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия манифеста'),
+        ),
+        migrations.AddField(
+            model_name='tickets',
+            name='manifest_version',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Версия манифеста'),
+        ),
+        migrations.AddIndex(
+            model_name='tickets',
+            index=models.Index(fields=['ship', 'ticket_day', 'manifest_version'], name='tickets_manifest_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.1.7 on 2026-10-18 08:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0008_manifest_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('День', 'День'), ('Месяц', 'Месяц')], max_length=5, verbose_name='Период')),
+                ('period_start', models.DateField(verbose_name='Начало периода')),
+                ('tickets_count', models.IntegerField(default=0, verbose_name='Количество билетов')),
+                ('adult_quantity', models.IntegerField(default=0, verbose_name='Количество взрослых')),
+                ('child_quantity', models.IntegerField(default=0, verbose_name='Количество детей')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма продаж')),
+                ('area', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='server.landingplaces', verbose_name='Площадка')),
+                ('operator', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to=settings.AUTH_USER_MODEL, verbose_name='Оператор')),
+                ('ship', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='server.ship', verbose_name='Судно')),
+            ],
+            options={
+                'verbose_name': 'Сводка продаж',
+                'verbose_name_plural': 'Сводки продаж',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='salesrollup',
+            index=models.Index(fields=['period', 'period_start', 'operator'], name='sales_rollup_operator_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='salesrollup',
+            unique_together={('period', 'period_start', 'operator', 'ship', 'area')},
+        ),
+    ]
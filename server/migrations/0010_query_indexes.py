@@ -0,0 +1,52 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0009_sales_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='evotortoken',
+            name='token',
+            field=models.CharField(blank=True, db_index=True, max_length=250, null=True, verbose_name='Токен'),
+        ),
+        migrations.AlterField(
+            model_name='evotortoken',
+            name='userId',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='UserID'),
+        ),
+        migrations.AlterField(
+            model_name='evotorusers',
+            name='userId',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='UserID'),
+        ),
+        migrations.AddIndex(
+            model_name='pointssale',
+            index=models.Index(fields=['operator', 'create_data', 'status'], name='pointssale_open_shift_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesreport',
+            index=models.Index(fields=['operator', 'report_date'], name='salesreport_operator_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='salesreport',
+            index=models.Index(fields=['report_date', 'id'], name='salesreport_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tickets',
+            index=models.Index(fields=['operator', 'created_at', 'id'], name='tickets_operator_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tickets',
+            index=models.Index(fields=['ticket_day', 'ship'], name='tickets_day_ship_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tickets',
+            index=models.Index(fields=['created_at', 'id'], name='tickets_created_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.1.7 on 2026-10-18 16:10
+
+from datetime import date
+
+from django.db import migrations
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_sold(apps, schema_editor):
+    Tickets = apps.get_model('server', 'Tickets')
+    DepartureCapacity = apps.get_model('server', 'DepartureCapacity')
+    rows = Tickets.objects.filter(ticket_return=False, ticket_day__gte=date.today()).values(
+        'ship_id', 'ticket_day'
+    ).annotate(seats=Sum(Coalesce('adult_quantity', 0) + Coalesce('child_quantity', 0))).order_by()
+    sold = {(row['ship_id'], row['ticket_day']): row['seats'] or 0 for row in rows}
+    for ledger in DepartureCapacity.objects.filter(ticket_day__gte=date.today()):
+        ledger.sold = sold.get((ledger.schedule_id, ledger.ticket_day), 0)
+        ledger.save(update_fields=['sold'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0010_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_sold, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0011_backfill_departure_sold'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='salesrollup',
+            name='area',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='server.landingplaces', verbose_name='Площадка'),
+        ),
+        migrations.AddConstraint(
+            model_name='salesrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('area__isnull', True)), fields=('period', 'period_start', 'operator', 'ship'), name='sales_rollup_no_area_unique'),
+        ),
+    ]
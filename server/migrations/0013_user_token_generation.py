@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 09:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('server', '0012_sales_rollup_optional_area'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='token_generation',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Поколение токенов'),
+        ),
+    ]
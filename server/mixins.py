@@ -0,0 +1,97 @@
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework.response import Response
+
+from .fast_serializers import values_serializer
+from .reference_cache import reference_etag, get_reference_response, set_reference_response
+from .sparse_fields import requested_shape
+
+
+def apply_eager_loading(queryset, select_related=None, prefetch_related=None, fields=None, expand=None):
+    """
+    Подключает select_related/prefetch_related из плана загрузки. План задается
+    словарями {поле сериализатора: связи}; fields ограничивает план этими полями.
+    Связи вне expand отдаются ключами: для них план не нужен, а множественным
+    связям достаточно prefetch самой связи без вложенных.
+    """
+    select_related = select_related or {}
+    prefetch_related = prefetch_related or {}
+    opts = queryset.model._meta
+
+    def planned(plan):
+        for field, lookups in plan.items():
+            if fields is not None and field not in fields:
+                continue
+            if expand is None or field in expand:
+                yield from lookups
+            elif opts.get_field(field).many_to_many or opts.get_field(field).one_to_many:
+                yield field
+
+    selected = list(planned(select_related))
+    prefetched = list(dict.fromkeys(planned(prefetch_related)))
+    if selected:
+        queryset = queryset.select_related(*selected)
+    if prefetched:
+        queryset = queryset.prefetch_related(*prefetched)
+    return queryset
+
+
+class EagerLoadingMixin:
+    """
+    План загрузки списка: вложенные сериализаторы получают связи одним JOIN
+    или одним дополнительным запросом на связь, а не запросом на строку.
+    """
+    select_related = {}
+    prefetch_related = {}
+
+    def get_queryset(self):
+        return apply_eager_loading(
+            super().get_queryset(), self.select_related, self.prefetch_related, *requested_shape(self.request)
+        )
+
+
+class ValuesListMixin:
+    """
+    GET списка через values(): JSON той же формы, что у serializer_class,
+    без создания моделей и полей сериализатора на каждую строку.
+    """
+    values_serializer_class = None
+
+    def get_values_serializer(self):
+        return values_serializer(
+            self.values_serializer_class or self.get_serializer_class(), *requested_shape(self.request)
+        )
+
+    def list_values(self, queryset):
+        return self.get_values_serializer().data(queryset)
+
+    def list(self, request, *args, **kwargs):
+        values = self.get_values_serializer()
+        keyset = [name.lstrip('-') for name in getattr(self, 'keyset_ordering', ())]
+        rows = values.values(self.filter_queryset(self.get_queryset()), *keyset)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(values.serialize(page))
+        return Response(values.serialize(rows))
+
+
+class ReferenceCacheMixin:
+    """
+    Кэш GET справочника по версиям reference_models. Ответ помечается сильным
+    ETag; совпавший If-None-Match получает 304 без запросов к справочникам и без тела.
+    """
+    reference_models = ()
+
+    def get(self, request, *args, **kwargs):
+        etag = reference_etag(request, self.reference_models)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            data = get_reference_response(etag)
+            if data is not None:
+                response = Response(data)
+            else:
+                response = super().get(request, *args, **kwargs)
+                if response.status_code == 200:
+                    set_reference_response(etag, response.data)
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -3,7 +3,7 @@ from django.core.exceptions import ValidationError
 from django.contrib.auth import logout
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
-from server.element_select import USER_TYPE, CHILD_OR_ABULT, SHIFT_STATUS
+from server.element_select import USER_TYPE, CHILD_OR_ABULT, SHIFT_STATUS, ROLLUP_PERIOD
 from server.manager import UserManager
 from django.utils import timezone
 import uuid
@@ -26,6 +26,7 @@ class User(AbstractBaseUser, PermissionsMixin):
     date_of_registration = models.DateTimeField(auto_now=True, verbose_name='Дата регистрации', null=True, blank=True)
     last_login = models.DateTimeField(null=True, blank=True, verbose_name='Последний вход')
     last_logout = models.DateTimeField(null=True, blank=True, verbose_name='Последний выход')
+    token_generation = models.PositiveIntegerField(default=0, editable=False, verbose_name='Поколение токенов')
 
     USERNAME_FIELD = 'username'
     objects = UserManager()
@@ -100,6 +101,12 @@ class Tickets(models.Model):
         verbose_name = 'Билет'
         verbose_name_plural = 'Билеты'
         ordering = ('created_at',)
+        indexes = [
+            models.Index(fields=('ship', 'ticket_day', 'manifest_version'), name='tickets_manifest_idx'),
+            models.Index(fields=('operator', 'created_at', 'id'), name='tickets_operator_created_idx'),
+            models.Index(fields=('ticket_day', 'ship'), name='tickets_day_ship_idx'),
+            models.Index(fields=('created_at', 'id'), name='tickets_created_idx'),
+        ]
 
     operator = models.ForeignKey(
         'PointsSale',
@@ -162,11 +169,14 @@ class Tickets(models.Model):
         null=True,
         default=False
     )
-    check_qr_text = models.ImageField(
-        verbose_name='Чек',
+    check_rendered_at = models.DateTimeField(
+        verbose_name='Чек нарисован',
         blank=True,
-        null=True,
-        upload_to='tickets/check/'
+        null=True
+    )
+    check_layout = models.PositiveSmallIntegerField(
+        verbose_name='Версия макета чека',
+        default=0
     )
     ticket_verified = models.BooleanField(
         blank=True,
@@ -178,6 +188,10 @@ class Tickets(models.Model):
         verbose_name='Возрат билета',
         default=False,
     )
+    manifest_version = models.PositiveBigIntegerField(
+        verbose_name='Версия манифеста',
+        default=0
+    )
 
     def __str__(self):
         return f"{'Куплен' if self.bought else 'Не куплен'} --- {self.ship} --- {self.created_at}"
@@ -238,6 +252,39 @@ class ShipSchedule(models.Model):
         return f"{self.ship} - {self.start_time} - {self.end_time}"
 
 
+class DepartureCapacity(models.Model):
+    class Meta:
+        verbose_name = 'Загрузка рейса'
+        verbose_name_plural = 'Загрузка рейсов'
+        unique_together = ('schedule', 'ticket_day')
+
+    schedule = models.ForeignKey(
+        ShipSchedule,
+        on_delete=models.CASCADE,
+        related_name='capacities',
+        verbose_name='Время посадки'
+    )
+    ticket_day = models.DateField(
+        verbose_name='День билета'
+    )
+    capacity = models.PositiveIntegerField(
+        verbose_name='Вместимость',
+        null=True,
+        blank=True
+    )
+    sold = models.PositiveIntegerField(
+        verbose_name='Продано мест',
+        default=0
+    )
+    version = models.PositiveBigIntegerField(
+        verbose_name='Версия манифеста',
+        default=0
+    )
+
+    def __str__(self):
+        return f"{self.schedule} -- {self.ticket_day}: {self.sold}/{self.capacity}"
+
+
 class LandingPlaces(models.Model):
     class Meta:
         verbose_name = 'Посадочное место'
@@ -263,6 +310,9 @@ class PointsSale(models.Model):
     class Meta:
         verbose_name = 'Точка продажи'
         verbose_name_plural = 'Точки продажи'
+        indexes = [
+            models.Index(fields=('operator', 'create_data', 'status'), name='pointssale_open_shift_idx'),
+        ]
 
     operator = models.ForeignKey(
         User,
@@ -317,6 +367,10 @@ class SalesReport(models.Model):
     class Meta:
         verbose_name = 'Отчет о продажах'
         verbose_name_plural = 'Отчеты о продажах'
+        indexes = [
+            models.Index(fields=('operator', 'report_date'), name='salesreport_operator_date_idx'),
+            models.Index(fields=('report_date', 'id'), name='salesreport_date_idx'),
+        ]
 
     operator = models.ForeignKey(
         PointsSale,
@@ -360,6 +414,74 @@ class SalesReport(models.Model):
         return f"{self.operator} -- {self.report_date}"
 
 
+class SalesRollup(models.Model):
+    class Meta:
+        verbose_name = 'Сводка продаж'
+        verbose_name_plural = 'Сводки продаж'
+        unique_together = ('period', 'period_start', 'operator', 'ship', 'area')
+        indexes = [
+            models.Index(fields=('period', 'period_start', 'operator'), name='sales_rollup_operator_idx'),
+        ]
+        constraints = [
+            # unique_together не действует на строки без площадки: NULL в индексе всегда различны.
+            models.UniqueConstraint(
+                fields=('period', 'period_start', 'operator', 'ship'),
+                condition=models.Q(area__isnull=True),
+                name='sales_rollup_no_area_unique'
+            ),
+        ]
+
+    period = models.CharField(
+        verbose_name='Период',
+        choices=ROLLUP_PERIOD,
+        max_length=5
+    )
+    period_start = models.DateField(
+        verbose_name='Начало периода'
+    )
+    operator = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Оператор',
+        related_name='sales_rollups'
+    )
+    ship = models.ForeignKey(
+        Ship,
+        on_delete=models.CASCADE,
+        verbose_name='Судно',
+        related_name='sales_rollups'
+    )
+    area = models.ForeignKey(
+        LandingPlaces,
+        on_delete=models.CASCADE,
+        verbose_name='Площадка',
+        blank=True,
+        null=True,
+        related_name='sales_rollups'
+    )
+    tickets_count = models.IntegerField(
+        verbose_name='Количество билетов',
+        default=0
+    )
+    adult_quantity = models.IntegerField(
+        verbose_name='Количество взрослых',
+        default=0
+    )
+    child_quantity = models.IntegerField(
+        verbose_name='Количество детей',
+        default=0
+    )
+    total_amount = models.DecimalField(
+        verbose_name='Сумма продаж',
+        decimal_places=2,
+        max_digits=14,
+        default=0
+    )
+
+    def __str__(self):
+        return f"{self.period} {self.period_start} -- {self.operator}"
+
+
 class EvotorUsers(models.Model):
     class Meta:
         verbose_name = 'Пользователи Эвотор'
@@ -368,6 +490,7 @@ class EvotorUsers(models.Model):
     userId = models.CharField(
         verbose_name='UserID',
         max_length=100,
+        db_index=True,
         # unique=True
     )
     token = models.CharField(
@@ -390,6 +513,7 @@ class EvotorToken(models.Model):
     userId = models.CharField(
         verbose_name='UserID',
         max_length=100,
+        db_index=True,
         # unique=True
     )
     token = models.CharField(
@@ -397,6 +521,7 @@ class EvotorToken(models.Model):
         max_length=250,
         blank=True,
         null=True,
+        db_index=True,
         # unique=True
     )
 
@@ -0,0 +1,117 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Постраничная выдача по ключу: курсор хранит значения полей сортировки
+    последней строки, следующая страница выбирается условием WHERE по этим
+    полям без OFFSET. Поля берутся из keyset_ordering представления,
+    '-' в начале означает сортировку по убыванию. Последним полем должен
+    быть уникальный столбец, обычно id. NULL сортируются в конце.
+    """
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def __init__(self, ordering=None):
+        self.ordering = ordering
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, fields):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            if len(values) != len(fields):
+                raise ValueError
+            return [None if value is None else field.to_python(value) for field, value in zip(fields, values)]
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode()
+
+    def after(self, fields, descending, values):
+        """Условие "строго после" для кортежа полей: (a > x) или (a = x и (b > y ...))."""
+        field, value = fields[0], values[0]
+        tail = self.after(fields[1:], descending[1:], values[1:]) if len(fields) > 1 else None
+        if value is None:
+            return Q(**{f'{field.name}__isnull': True}) & tail if tail is not None else Q(pk__in=[])
+        beyond = Q(**{f"{field.name}__{'lt' if descending[0] else 'gt'}": value})
+        if field.null:
+            beyond |= Q(**{f'{field.name}__isnull': True})
+        if tail is None:
+            return beyond
+        return beyond | (Q(**{field.name: value}) & tail)
+
+    def order_by(self, field, descending):
+        # NULLS LAST добавляется только для nullable полей, чтобы сортировка совпадала с обычным индексом.
+        if descending:
+            return F(field.name).desc(nulls_last=True) if field.null else F(field.name).desc()
+        return F(field.name).asc(nulls_last=True) if field.null else F(field.name).asc()
+
+    def value_of(self, row, field):
+        # Строки queryset.values() приходят словарями.
+        if isinstance(row, dict):
+            return row[field.name]
+        return field.value_from_object(row)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = self.ordering or getattr(view, 'keyset_ordering', ('id',))
+        descending = [name.startswith('-') for name in ordering]
+        fields = [queryset.model._meta.get_field(name.lstrip('-')) for name in ordering]
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+
+        queryset = queryset.order_by(*[self.order_by(field, desc) for field, desc in zip(fields, descending)])
+        values = self.decode_cursor(request, fields)
+        if values is not None:
+            queryset = queryset.filter(self.after(fields, descending, values))
+
+        page = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(page) > self.page_size_value
+        page = page[:self.page_size_value]
+        self.next_values = None
+        if self.has_next:
+            self.next_values = [self.value_of(page[-1], field) for field in fields]
+        return page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_values))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -1,7 +1,6 @@
-from django.utils import timezone
 from rest_framework.exceptions import PermissionDenied
 from rest_framework import permissions
-from server.models import PointsSale
+from server.services import get_request_points_sale
 from rest_framework.exceptions import APIException
 from rest_framework import status
 
@@ -25,11 +24,7 @@ class IsSudovoditel(permissions.BasePermission):
 class IsOperator(permissions.BasePermission):
     def has_permission(self, request, view):
         if request.user.user_type == 'Оператор':
-            operator = request.user
-            current_date = timezone.now().date()
-            points_sale = PointsSale.objects.filter(
-                operator=operator, create_data=current_date, status='Открытая смена'
-            ).first()
+            points_sale = get_request_points_sale(request)
             if not points_sale:
                 raise PermissionDenied('Невозможно создать билет. Смена не открыта.')
             return True
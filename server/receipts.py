@@ -0,0 +1,386 @@
+import gzip
+import io
+import logging
+import multiprocessing
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import django
+import qrcode
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+from server.models import Tickets
+from server.ticket_codes import encode_ticket_code
+
+logger = logging.getLogger(__name__)
+
+THERMAL_WIDTH = 384
+THERMAL_THRESHOLD = 160
+ESCPOS_BAND_HEIGHT = 256
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ReceiptTemplate:
+    """
+    Постоянная часть чека: фон с логотипом, шрифт и заранее растеризованные
+    подписи строк. Собирается один раз на воркер, render() дорисовывает
+    только данные билета и QR-код.
+    """
+    height = 900
+    logo_width = 550
+    text_top = 100
+    text_spacing = 27
+    qr_size = 300
+    labels = (
+        'Кассир: ',
+        'билет действителен до: ',
+        '',
+        'Время начало: ',
+        'Время окончания: ',
+        '',
+        'Судно: ',
+        'Площадка: ',
+        'Причал: ',
+        'Количество взрослых: ',
+        'Количество детей: ',
+        'Дата билета: ',
+        '------------------------------------------------\nОбщая сумма: ',
+        '',
+        '',
+    )
+
+    def __init__(self, width=400):
+        self.size = (width, self.height)
+        self.font = ImageFont.truetype(settings.RECEIPT_FONT, 13, encoding="unic")
+        self.background = Image.new('RGB', self.size, (255, 255, 255))
+        logo_image = Image.open(os.path.join(settings.MEDIA_ROOT, 'images', 'логотип_Восход.png'))
+        logo_height = int((self.logo_width / logo_image.width) * logo_image.height)
+        logo_image = logo_image.resize((self.logo_width, logo_height))
+        self.background.paste(logo_image, ((self.size[0] - logo_image.width) // 2, 10))
+
+        line_height = self.font.getbbox('A')[3] + 4
+        self.label_masks = []
+        self.value_offsets = []
+        measure = ImageDraw.Draw(Image.new('L', (1, 1)))
+        for label in self.labels:
+            mask = None
+            if label:
+                right, bottom = measure.multiline_textbbox((0, 0), label, font=self.font)[2:]
+                mask = Image.new('L', (int(right) + 1, int(bottom) + 1))
+                ImageDraw.Draw(mask).multiline_text((0, 0), label, font=self.font, fill=255)
+            last_line = label.split('\n')
+            self.label_masks.append(mask)
+            self.value_offsets.append((self.font.getlength(last_line[-1]), line_height * (len(last_line) - 1)))
+
+    def values(self, instance):
+        return (
+            instance.operator,
+            instance.ticket_day,
+            '',
+            instance.ship.start_time,
+            instance.ship.end_time,
+            '',
+            instance.ship.ship,
+            instance.area.address,
+            instance.ship.berths,
+            instance.adult_quantity,
+            instance.child_quantity,
+            instance.created_at,
+            instance.total_amount,
+            '',
+            instance,
+        )
+
+    def render(self, instance):
+        check_image = self.background.copy()
+        draw = ImageDraw.Draw(check_image)
+        values = [str(value) for value in self.values(instance)]
+        text_width = max(
+            offset_x + self.font.getlength(value) for (offset_x, _), value in zip(self.value_offsets, values)
+        )
+        x = int(self.size[0] - text_width) // 2
+        y = self.text_top
+        for mask, (offset_x, offset_y), value in zip(self.label_masks, self.value_offsets, values):
+            if mask is not None:
+                draw.bitmap((x, y), mask, fill=(0, 0, 0))
+            if value:
+                draw.text((x + offset_x, y + offset_y), value, font=self.font, fill=(0, 0, 0))
+            y += self.text_spacing
+
+        qr_position = ((self.size[0] - self.qr_size) // 2, self.size[1] - self.qr_size - 70)
+        check_image.paste(render_qr(encode_ticket_code(instance), self.qr_size), qr_position)
+        return check_image
+
+
+def render_qr(data, size, border=2):
+    """
+    Растеризует QR-код сразу под нужный размер: по одному пикселю на модуль
+    в 1-битном буфере, затем целочисленное увеличение без сглаживания.
+    Код центрируется на белом квадрате size x size.
+    """
+    qr_code = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_L, border=border)
+    qr_code.add_data(data)
+    qr_code.make(fit=True)
+    matrix = qr_code.get_matrix()
+    modules = len(matrix)
+    box_size = max(size // modules, 1)
+    module_image = Image.new('1', (modules, modules))
+    module_image.putdata([0 if dark else 1 for row in matrix for dark in row])
+    qr_image = Image.new('1', (size, size), 1)
+    offset = (size - modules * box_size) // 2
+    qr_image.paste(module_image.resize((modules * box_size, modules * box_size), Image.NEAREST), (offset, offset))
+    return qr_image
+
+
+_templates = threading.local()
+
+
+def get_receipt_template(width=400):
+    templates = getattr(_templates, 'by_width', None)
+    if templates is None:
+        templates = _templates.by_width = {}
+    if width not in templates:
+        templates[width] = ReceiptTemplate(width)
+    return templates[width]
+
+
+def render_thermal(instance):
+    """Чек для термопринтера 58 мм: 384 точки в ширину, 1 бит на точку."""
+    image = get_receipt_template(THERMAL_WIDTH).render(instance)
+    return image.convert('L').point(lambda value: 255 if value >= THERMAL_THRESHOLD else 0, '1')
+
+
+def encode_raster(image):
+    """Упакованный растр в формате PBM (P4): 1 бит на точку, 1 — черная точка."""
+    buffer = io.BytesIO()
+    image.save(buffer, format='PPM')
+    return buffer.getvalue()
+
+
+def encode_escpos(image):
+    """Поток ESC/POS: инициализация, полосы GS v 0 и отрезка бумаги."""
+    row_bytes = image.width // 8
+    dots = ImageChops.invert(image).tobytes()
+    commands = [b'\x1b@']
+    for top in range(0, image.height, ESCPOS_BAND_HEIGHT):
+        rows = min(ESCPOS_BAND_HEIGHT, image.height - top)
+        commands.append(b'\x1dv0\x00' + struct.pack('<HH', row_bytes, rows))
+        commands.append(dots[top * row_bytes:(top + rows) * row_bytes])
+    commands.append(b'\x1bd\x04\x1dVB\x00')
+    return b''.join(commands)
+
+
+def render_png(instance):
+    buffer = io.BytesIO()
+    get_receipt_template().render(instance).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+RECEIPT_OUTPUTS = {
+    'png': ('image/png', 'png', render_png),
+    'raster': ('image/x-portable-bitmap', 'pbm', lambda instance: encode_raster(render_thermal(instance))),
+    'escpos': ('application/octet-stream', 'escpos', lambda instance: encode_escpos(render_thermal(instance))),
+}
+
+# Растр и ESC/POS почти целиком из белых точек: в кэше они хранятся в gzip, примерно в 17 раз меньше.
+RECEIPT_GZIP_OUTPUTS = ('raster', 'escpos')
+
+
+def render_stored(instance, output):
+    """Чек в том виде, в котором он хранится в кэше."""
+    data = RECEIPT_OUTPUTS[output][2](instance)
+    if output in RECEIPT_GZIP_OUTPUTS:
+        data = gzip.compress(data, mtime=0)
+    return data
+
+
+class ReceiptCache:
+    """
+    Двухуровневый LRU для готовых чеков: словарь в памяти процесса,
+    ограниченный по байтам, и каталог на диске, ограниченный по числу файлов.
+    Ключ содержит время отрисовки, поэтому устаревшие записи просто вытесняются.
+    """
+    prune_every = 200
+
+    def __init__(self, directory, memory_bytes, disk_files):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_files = disk_files
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        ticket_id, output, rendered_at = key
+        stamp = int(rendered_at.timestamp() * 1000)
+        extension = RECEIPT_OUTPUTS[output][1] + ('.gz' if output in RECEIPT_GZIP_OUTPUTS else '')
+        return os.path.join(self.directory, f'check_{ticket_id}_{stamp}.{extension}')
+
+    def get(self, key):
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def set(self, key, data):
+        path = self.path(key)
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as f:
+            f.write(data)
+        os.replace(temporary_path, path)
+        self._remember(key, data)
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            self.prune_disk()
+
+    def _remember(self, key, data):
+        with self._lock:
+            if key in self._memory:
+                self._memory_size -= len(self._memory.pop(key))
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.memory_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+
+    def prune_disk(self):
+        try:
+            entries = [entry for entry in os.scandir(self.directory) if entry.is_file()]
+        except OSError:
+            return
+        if len(entries) <= self.disk_files:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.disk_files]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+receipt_cache = ReceiptCache(
+    settings.RECEIPT_CACHE_DIR, settings.RECEIPT_CACHE_MEMORY_BYTES, settings.RECEIPT_CACHE_DISK_FILES
+)
+
+
+def is_receipt_current(ticket):
+    return ticket.check_rendered_at is not None and ticket.check_layout == settings.RECEIPT_LAYOUT_VERSION
+
+
+def receipt_encoding(output, accept_encoding):
+    """'gzip', если чек хранится сжатым и клиент принимает gzip, иначе None."""
+    return 'gzip' if output in RECEIPT_GZIP_OUTPUTS and 'gzip' in accept_encoding else None
+
+
+def receipt_etag(ticket, output, encoding=None):
+    rendered_at = int(ticket.check_rendered_at.timestamp() * 1000)
+    suffix = f'-{encoding}' if encoding else ''
+    return f'"{ticket.pk}-{ticket.check_layout}-{rendered_at}-{output}{suffix}"'
+
+
+def get_receipt(ticket, output='png', encoding=None):
+    """
+    Возвращает байты чека из кэша или рисует его при первом запросе.
+    При encoding='gzip' сжатый чек отдается как хранится, иначе распаковывается.
+    После отрисовки в билете обновляются только метаданные.
+    """
+    data = receipt_cache.get((ticket.pk, output, ticket.check_rendered_at)) if is_receipt_current(ticket) else None
+    if data is None:
+        data = _render_receipt(ticket, output)
+    if output in RECEIPT_GZIP_OUTPUTS and encoding != 'gzip':
+        data = gzip.decompress(data)
+    return data
+
+
+def _render_receipt(ticket, output):
+    if not is_receipt_current(ticket):
+        ticket.check_rendered_at = timezone.now()
+        ticket.check_layout = settings.RECEIPT_LAYOUT_VERSION
+        Tickets.objects.filter(pk=ticket.pk).update(
+            check_rendered_at=ticket.check_rendered_at, check_layout=ticket.check_layout
+        )
+    data = render_stored(ticket, output)
+    receipt_cache.set((ticket.pk, output, ticket.check_rendered_at), data)
+    return data
+
+
+def render_ticket_checks(ticket_ids, outputs=('png',)):
+    """
+    Заранее рисует чеки пачки билетов в кэш. Метаданные сохраняются через
+    bulk_update(), поэтому сигналы Tickets не вызываются.
+    Возвращает количество нарисованных чеков.
+    """
+    rendered = []
+    rendered_at = timezone.now()
+    tickets = Tickets.objects.select_related(
+        'operator__operator', 'ship__ship', 'ship__berths', 'area'
+    ).filter(pk__in=ticket_ids)
+    for ticket in tickets:
+        try:
+            for output in outputs:
+                receipt_cache.set((ticket.pk, output, rendered_at), render_stored(ticket, output))
+        except Exception:
+            logger.exception(f"Не удалось сформировать чек для билета {ticket.pk}")
+            continue
+        ticket.check_rendered_at = rendered_at
+        ticket.check_layout = settings.RECEIPT_LAYOUT_VERSION
+        rendered.append(ticket)
+    Tickets.objects.bulk_update(rendered, ['check_rendered_at', 'check_layout'])
+    return len(rendered)
+
+
+def render_in_worker(ticket_ids, outputs=('png',)):
+    """Точка входа для пулов потоков и процессов: свои соединения с базой на каждую пачку."""
+    close_old_connections()
+    try:
+        return render_ticket_checks(ticket_ids, outputs)
+    finally:
+        close_old_connections()
+
+
+def create_process_pool(workers):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup
+    )
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = settings.RECEIPT_RENDER_WORKERS
+            if settings.RECEIPT_RENDER_POOL == 'process':
+                _executor = create_process_pool(workers)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='receipt-render')
+    return _executor
+
+
+def prewarm_checks(ticket_ids):
+    """Если включен RECEIPT_PREWARM, рисует чеки в фоне сразу после продажи."""
+    if settings.RECEIPT_PREWARM:
+        ticket_ids = list(ticket_ids)
+        transaction.on_commit(lambda: get_executor().submit(render_in_worker, ticket_ids))
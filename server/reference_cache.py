@@ -0,0 +1,43 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from server.utils import bump_version, new_version
+
+
+def _version_key(model):
+    return f'reference:version:{model._meta.label_lower}'
+
+
+def bump_reference_version(model):
+    """После фиксации транзакции увеличивает версию справочника."""
+    key = _version_key(model)
+    transaction.on_commit(lambda: bump_version(key))
+
+
+def reference_versions(models):
+    keys = [_version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def reference_etag(request, models):
+    """
+    Сильный ETag ответа: версии справочников, путь с параметрами и формат ответа.
+    Пока справочники не менялись, тот же запрос дает те же байты.
+    """
+    source = repr((request.get_full_path(), request.accepted_renderer.format, reference_versions(models)))
+    return f'"{hashlib.md5(source.encode()).hexdigest()}"'
+
+
+def get_reference_response(etag):
+    return cache.get(f'reference:response:{etag}')
+
+
+def set_reference_response(etag, data):
+    cache.set(f'reference:response:{etag}', data, settings.REFERENCE_CACHE_TIMEOUT)
@@ -1,21 +1,24 @@
-from django.db.models import Q, Max, Min
-from django.db.models import Sum
+from django.db.models import Max, Min
 from rest_framework import serializers
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
 from rest_framework import status
-from django.shortcuts import get_object_or_404
 import logging
 from .models import (
     LandingPlaces, PointsSale, PriceTypes, Price, Tickets, User, Ship, ShipSchedule, SalesReport, EvotorUsers,
     EvotorToken, Shops, EvotorOperator, Terminal, Product
 
 )
+from .analytics import ANALYTICS_GROUPS
+from .exports import EXPORT_OUTPUTS
+from .services import get_request_points_sale, issue_ticket, issue_tickets
+from .sparse_fields import SparseFieldsMixin
 
 
 logger = logging.getLogger(__name__)
 
 
-class UserLoginSerializer(serializers.ModelSerializer):
+class UserLoginSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = (
@@ -24,7 +27,7 @@ class UserLoginSerializer(serializers.ModelSerializer):
         )
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user_type = serializers.SerializerMethodField()
 
     class Meta:
@@ -35,7 +38,7 @@ class UserSerializer(serializers.ModelSerializer):
         return obj.get_user_type_display()
 
 
-class CreateUserSerializer(serializers.ModelSerializer):
+class CreateUserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
 
     class Meta:
@@ -51,7 +54,7 @@ class CreateUserSerializer(serializers.ModelSerializer):
         return user
 
 
-class PriceSerializer(serializers.ModelSerializer):
+class PriceSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Price
         fields = ('id', 'price')
@@ -62,7 +65,7 @@ class PriceSerializer(serializers.ModelSerializer):
         return value
 
 
-class PriceTypesSerializer(serializers.ModelSerializer):
+class PriceTypesSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = PriceTypes
         fields = ('id', 'price', 'client_type')
@@ -75,7 +78,7 @@ class PriceTypesSerializer(serializers.ModelSerializer):
         return data
 
 
-class PriceTypesPriceGETSerializer(serializers.ModelSerializer):
+class PriceTypesPriceGETSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     price = PriceSerializer()
 
     class Meta:
@@ -83,7 +86,7 @@ class PriceTypesPriceGETSerializer(serializers.ModelSerializer):
         fields = ('id', 'price', 'client_type')
 
 
-class ShipAllSerializer(serializers.ModelSerializer):
+class ShipAllSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Ship
         fields = ('id', 'vessel_name', 'restrictions')
@@ -98,13 +101,36 @@ class ShipAllSerializer(serializers.ModelSerializer):
         return data
 
 
-class TicketsCreateSerializer(serializers.ModelSerializer):
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Запоминает найденные объекты в контексте, чтобы список продаж не читал один и тот же рейс заново."""
+
+    def to_internal_value(self, data):
+        cache = self.context.setdefault('related_objects', {})
+        key = (self.get_queryset().model, str(data))
+        if key not in cache:
+            cache[key] = super().to_internal_value(data)
+        return cache[key]
+
+
+class TicketsBulkCreateSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        points_sale = get_request_points_sale(self.context['request'])
+        if points_sale is None:
+            raise NotFound({'Сообщение': 'Смена не открыта.'})
+        for sale in validated_data:
+            sale.pop('operator', None)
+        return issue_tickets(points_sale, validated_data)
+
+
+class TicketsCreateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    serializer_related_field = CachedPrimaryKeyRelatedField
     operator = serializers.PrimaryKeyRelatedField(read_only=True, default=serializers.CurrentUserDefault())
 
     class Meta:
         model = Tickets
+        list_serializer_class = TicketsBulkCreateSerializer
         fields = (
-            'operator', 'ship', 'area', 'price_types', 'ticket_day',
+            'id', 'operator', 'ship', 'area', 'price_types', 'ticket_day',
             'adult_quantity', 'child_quantity', 'bought'
         )
 
@@ -119,19 +145,20 @@ class TicketsCreateSerializer(serializers.ModelSerializer):
         return data
 
     def create(self, validated_data):
-        user = self.context['request'].user
-        points_sale = get_object_or_404(PointsSale, operator=user)
-        validated_data['operator'] = points_sale
-        return super().create(validated_data)
+        points_sale = get_request_points_sale(self.context['request'])
+        if points_sale is None:
+            raise NotFound({'Сообщение': 'Смена не открыта.'})
+        validated_data.pop('operator', None)
+        return issue_ticket(points_sale, **validated_data)
 
 
-class LandingPlacesGetSerializer(serializers.ModelSerializer):
+class LandingPlacesGetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = LandingPlaces
         fields = "__all__"
 
 
-class ShipScheduleGetAllSerializer(serializers.ModelSerializer):
+class ShipScheduleGetAllSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     ship = ShipAllSerializer()
 
     class Meta:
@@ -139,7 +166,7 @@ class ShipScheduleGetAllSerializer(serializers.ModelSerializer):
         fields = ('id', 'ship', 'start_time', 'end_time')
 
 
-class TicketsListSerializer(serializers.ModelSerializer):
+class TicketsListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     operator = serializers.HiddenField(default=serializers.CurrentUserDefault())
     price_types = PriceTypesPriceGETSerializer(many=True)
     ship = ShipScheduleGetAllSerializer()
@@ -150,13 +177,13 @@ class TicketsListSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class LandingPlacesSerializer(serializers.ModelSerializer):
+class LandingPlacesSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = LandingPlaces
         fields = "__all__"
 
 
-class PointsSaleCreateSerializer(serializers.ModelSerializer):
+class PointsSaleCreateSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     operator = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
@@ -164,7 +191,7 @@ class PointsSaleCreateSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class PointsSaleSerializer(serializers.ModelSerializer):
+class PointsSaleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     landing_places = LandingPlacesSerializer(many=True)
     operator = UserLoginSerializer()
 
@@ -173,7 +200,7 @@ class PointsSaleSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class PointsSaleEndStatus(serializers.ModelSerializer):
+class PointsSaleEndStatus(SparseFieldsMixin, serializers.ModelSerializer):
     operator = serializers.HiddenField(default=serializers.CurrentUserDefault())
 
     class Meta:
@@ -181,7 +208,7 @@ class PointsSaleEndStatus(serializers.ModelSerializer):
         fields = ('id', 'operator', 'complete_the_work_day')
 
 
-class ShipScheduleSerializer(serializers.ModelSerializer):
+class ShipScheduleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = ShipSchedule
         fields = ('id', 'ship', 'start_time', 'end_time')
@@ -228,7 +255,52 @@ class TicketSerializer(serializers.Serializer):
         }
 
 
-class SalesReportGETSerializer(serializers.ModelSerializer):
+class TicketBatchVerificationSerializer(serializers.Serializer):
+    qr = serializers.ListField(child=serializers.CharField(max_length=64), required=False, max_length=200)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=200)
+
+    def validate(self, attrs):
+        if not attrs.get('qr') and not attrs.get('ids'):
+            raise serializers.ValidationError({'Сообщение': 'Передайте список QR-кодов или ID билетов.'})
+        return attrs
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=list(EXPORT_OUTPUTS), default='csv')
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    date_from = serializers.DateField()
+    date_to = serializers.DateField()
+    group = serializers.ChoiceField(choices=ANALYTICS_GROUPS, default='schedule')
+
+    def validate(self, attrs):
+        if attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError({'Сообщение': 'Дата начала позже даты окончания.'})
+        if (attrs['date_to'] - attrs['date_from']).days > 366:
+            raise serializers.ValidationError({'Сообщение': 'Период не может быть длиннее года.'})
+        return attrs
+
+
+class ManifestQuerySerializer(serializers.Serializer):
+    ship = serializers.PrimaryKeyRelatedField(queryset=ShipSchedule.objects.all())
+    ticket_day = serializers.DateField()
+    since = serializers.IntegerField(min_value=0, required=False)
+
+
+class OfflineVerificationSerializer(serializers.Serializer):
+    qr = serializers.ListField(child=serializers.CharField(max_length=64), allow_empty=False, max_length=1000)
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+    date = serializers.DateField(required=False)
+    month = serializers.IntegerField(min_value=1, max_value=12, required=False)
+    year = serializers.IntegerField(min_value=1, max_value=9999, required=False)
+
+
+class SalesReportGETSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     operator = PointsSaleSerializer()
 
     class Meta:
@@ -261,22 +333,18 @@ class SalesReportGETSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
-        month = self.context.get('request').query_params.get('month')
-        year = self.context.get('request').query_params.get('year')
-        if month and year:
-            total_monthly_sales = SalesReport.objects.filter(
-                Q(report_date__month=month, report_date__year=year) &
-                Q(operator=instance.operator)
-            ).aggregate(
-                total_adult_quantity=Sum('total_adult_quantity'),
-                total_child_quantity=Sum('total_child_quantity'),
-                total_amount_report=Sum('total_amount_report')
-            )
-            data['total_monthly_sales'] = total_monthly_sales
+        # Итоги месяца читаются из сводки один раз на всю страницу и передаются через context.
+        monthly_totals = self.context.get('monthly_totals')
+        if monthly_totals is not None:
+            data['total_monthly_sales'] = monthly_totals.get(instance.operator_id, {
+                'total_adult_quantity': None,
+                'total_child_quantity': None,
+                'total_amount_report': None,
+            })
         return data
 
 
-class EvotorUsersSerializer(serializers.ModelSerializer):
+class EvotorUsersSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = EvotorUsers
         fields = ('id', 'userId', 'token')
@@ -293,31 +361,31 @@ class EvotorUsersSerializer(serializers.ModelSerializer):
     #     return data
 
 
-class EvotorTokenSerializer(serializers.ModelSerializer):
+class EvotorTokenSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = EvotorToken
         fields = '__all__'
 
 
-class ShopsSerializer(serializers.ModelSerializer):
+class ShopsSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Shops
         fields = '__all__'
 
 
-class EvotorOperatorSerializer(serializers.ModelSerializer):
+class EvotorOperatorSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = EvotorOperator
         fields = ['uuid', 'name', 'code', 'stores', 'role']
 
 
-class TerminalSerializer(serializers.ModelSerializer):
+class TerminalSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Terminal
         fields = '__all__'
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = '__all__'
@@ -0,0 +1,346 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DateField, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from server.models import Tickets, SalesReport, SalesRollup, PointsSale, PriceTypes, DepartureCapacity
+from server.analytics import bump_analytics_days
+from server.manifest import (
+    bump_manifest_version, current_manifest_version, get_departure_ledger, rebuild_departure_ledger
+)
+from server.gate_index import forget_ticket, index_tickets, is_marked_used
+
+
+def get_open_points_sale(user):
+    return PointsSale.objects.filter(
+        operator=user, create_data=timezone.now().date(), status='Открытая смена'
+    ).first()
+
+
+def _shift_key(operator_id, day):
+    return f'shift:open:{operator_id}:{day.isoformat()}'
+
+
+def get_cached_open_points_sale(user):
+    """Открытая смена из кэша на SHIFT_CACHE_TIMEOUT секунд. Отсутствие смены не кэшируется."""
+    key = _shift_key(user.pk, timezone.now().date())
+    points_sale = cache.get(key)
+    if points_sale is None:
+        points_sale = get_open_points_sale(user)
+        if points_sale is not None:
+            cache.set(key, points_sale, settings.SHIFT_CACHE_TIMEOUT)
+    return points_sale
+
+
+def forget_open_points_sale(points_sale):
+    """После фиксации транзакции убирает смену из кэша: закрытая смена больше не отдается."""
+    key = _shift_key(points_sale.operator_id, points_sale.create_data)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def get_request_points_sale(request):
+    """
+    Открытая смена пользователя запроса: права, представление и сериализатор
+    получают один объект. Токен, выданный на другую смену, смену не дает.
+    """
+    http_request = getattr(request, '_request', request)
+    if not hasattr(http_request, 'open_points_sale'):
+        points_sale = get_cached_open_points_sale(request.user)
+        claims = getattr(request, 'auth', None)
+        if isinstance(claims, dict) and points_sale is not None and claims.get('shift') != points_sale.pk:
+            points_sale = None
+        http_request.open_points_sale = points_sale
+    return http_request.open_points_sale
+
+
+def calculate_total_amount(price_types, adult_quantity, child_quantity):
+    adult_quantity = adult_quantity or 0
+    child_quantity = child_quantity or 0
+
+    total_amount = 0
+    for price_type in price_types:
+        price = price_type.price.price
+        if price_type.client_type == 'Ребенок':
+            total_amount += price * child_quantity
+        elif price_type.client_type == 'Взрослый':
+            total_amount += price * adult_quantity
+    return total_amount
+
+
+def apply_sales_delta(points_sale, adult_quantity, child_quantity, total_amount):
+    """Сдвигает счетчики отчета смены атомарным UPDATE вместо пересчета всех билетов."""
+    updated = SalesReport.objects.filter(operator=points_sale, report_date=points_sale.create_data).update(
+        total_adult_quantity=F('total_adult_quantity') + adult_quantity,
+        total_child_quantity=F('total_child_quantity') + child_quantity,
+        total_amount_report=F('total_amount_report') + total_amount,
+    )
+    if not updated:
+        SalesReport.objects.create(
+            operator=points_sale,
+            report_date=points_sale.create_data,
+            total_adult_quantity=adult_quantity,
+            total_child_quantity=child_quantity,
+            total_amount_report=total_amount,
+        )
+
+
+def reserve_seats(schedule, ticket_day, seats):
+    """
+    Занимает места на рейс условным UPDATE: строка учета блокируется до конца
+    транзакции, поэтому параллельные продажи с разных касс не превысят вместимость.
+    Возвращает новую версию манифеста рейса.
+    """
+    ledger = get_departure_ledger(schedule, ticket_day)
+    updated = DepartureCapacity.objects.filter(pk=ledger.pk).filter(
+        Q(capacity__isnull=True) | Q(sold__lte=F('capacity') - seats)
+    ).update(sold=F('sold') + seats, version=F('version') + 1)
+    if not updated:
+        ledger.refresh_from_db(fields=['capacity', 'sold'])
+        raise ValidationError({
+            'Сообщение': f'Недостаточно мест на рейс {schedule} {ticket_day}. '
+                         f'Осталось мест: {max(ledger.capacity - ledger.sold, 0)}.'
+        })
+    return current_manifest_version(schedule.pk, ticket_day)
+
+
+def release_seats(schedule_id, ticket_day, seats):
+    DepartureCapacity.objects.filter(schedule_id=schedule_id, ticket_day=ticket_day, sold__gte=seats).update(
+        sold=F('sold') - seats
+    )
+    return bump_manifest_version(schedule_id, ticket_day)
+
+
+def rebuild_sales_report(points_sale):
+    totals = points_sale.tickets_points_sale.filter(ticket_return=False).aggregate(
+        total_adult_quantity=Sum('adult_quantity'),
+        total_child_quantity=Sum('child_quantity'),
+        total_amount_report=Sum('total_amount'),
+    )
+    SalesReport.objects.update_or_create(
+        operator=points_sale,
+        report_date=points_sale.create_data,
+        defaults={key: value or 0 for key, value in totals.items()}
+    )
+
+
+ROLLUP_FIELDS = ('tickets_count', 'adult_quantity', 'child_quantity', 'total_amount')
+
+
+def month_bounds(day):
+    month_start = day.replace(day=1)
+    if month_start.month == 12:
+        return month_start, date(month_start.year + 1, 1, 1)
+    return month_start, date(month_start.year, month_start.month + 1, 1)
+
+
+def apply_rollup_delta(tickets, sign=1):
+    """
+    Сдвигает сводки продаж за день и месяц на проданные (sign=1) или
+    возвращенные (sign=-1) билеты. Билетам нужны загруженные operator и ship.
+    """
+    deltas = {}
+    for ticket in tickets:
+        day = ticket.operator.create_data
+        for period, period_start in (('День', day), ('Месяц', day.replace(day=1))):
+            key = (period, period_start, ticket.operator.operator_id, ticket.ship.ship_id, ticket.area_id)
+            delta = deltas.setdefault(key, dict.fromkeys(ROLLUP_FIELDS, 0))
+            delta['tickets_count'] += sign
+            delta['adult_quantity'] += sign * (ticket.adult_quantity or 0)
+            delta['child_quantity'] += sign * (ticket.child_quantity or 0)
+            delta['total_amount'] += sign * ticket.total_amount
+
+    # Строки блокируются в одном порядке; билеты без площадки идут первыми.
+    for (period, period_start, operator_id, ship_id, area_id), delta in sorted(
+        deltas.items(), key=lambda item: (*item[0][:4], item[0][4] or 0)
+    ):
+        rollup, _ = SalesRollup.objects.get_or_create(
+            period=period, period_start=period_start, operator_id=operator_id, ship_id=ship_id, area_id=area_id
+        )
+        SalesRollup.objects.filter(pk=rollup.pk).update(**{field: F(field) + value for field, value in delta.items()})
+
+
+def aggregate_rollups(tickets, period):
+    """Строки сводки за период из билетов одним GROUP BY."""
+    if period == 'Месяц':
+        period_start = TruncMonth('operator__create_data', output_field=DateField())
+    else:
+        period_start = F('operator__create_data')
+    rows = tickets.filter(ticket_return=False).annotate(period_start=period_start).values(
+        'period_start', 'operator__operator', 'ship__ship', 'area'
+    ).annotate(
+        tickets_count=Count('pk'),
+        adult_quantity=Sum('adult_quantity'),
+        child_quantity=Sum('child_quantity'),
+        total_amount=Sum('total_amount'),
+    ).order_by()
+    return [
+        SalesRollup(
+            period=period,
+            period_start=row['period_start'],
+            operator_id=row['operator__operator'],
+            ship_id=row['ship__ship'],
+            area_id=row['area'],
+            **{field: row[field] or 0 for field in ROLLUP_FIELDS}
+        )
+        for row in rows
+    ]
+
+
+def rebuild_sales_rollups(operator_id, day):
+    """Пересчитывает сводки оператора за день и месяц, например после правки билета в админке."""
+    month_start, next_month = month_bounds(day)
+    tickets = Tickets.objects.filter(operator__operator_id=operator_id)
+    month_tickets = tickets.filter(operator__create_data__gte=month_start, operator__create_data__lt=next_month)
+    for period, period_start, period_tickets in (
+        ('День', day, tickets.filter(operator__create_data=day)),
+        ('Месяц', month_start, month_tickets),
+    ):
+        SalesRollup.objects.filter(period=period, period_start=period_start, operator_id=operator_id).delete()
+        SalesRollup.objects.bulk_create(aggregate_rollups(period_tickets, period))
+
+
+def get_monthly_totals(year, month, points_sale_ids):
+    """Итоги месяца операторов смен points_sale_ids одним запросом к сводке, по ID смены."""
+    rollups = SalesRollup.objects.filter(
+        period='Месяц', period_start=date(year, month, 1), operator=OuterRef('operator')
+    ).values('operator').order_by()
+
+    def total(field):
+        return Subquery(rollups.annotate(total=Sum(field)).values('total'))
+
+    rows = PointsSale.objects.filter(pk__in=points_sale_ids).values(
+        'pk',
+        total_adult_quantity=total('adult_quantity'),
+        total_child_quantity=total('child_quantity'),
+        total_amount_report=total('total_amount'),
+    )
+    return {row.pop('pk'): row for row in rows}
+
+
+def issue_ticket(operator, price_types, **fields):
+    return issue_tickets(operator, [dict(fields, price_types=price_types)])[0]
+
+
+@transaction.atomic
+def issue_tickets(operator, sales):
+    """
+    Оформляет билеты одной транзакцией: суммы считаются до вставки,
+    билеты и типы цен пишутся через bulk_create, отчет обновляется один раз.
+    """
+    price_types = PriceTypes.objects.select_related('price').in_bulk(
+        {price_type.pk for sale in sales for price_type in sale['price_types']}
+    )
+    tickets = []
+    ticket_price_types = []
+    for sale in sales:
+        fields = dict(sale)
+        sale_price_types = [price_types[price_type.pk] for price_type in fields.pop('price_types')]
+        tickets.append(Tickets(
+            operator=operator,
+            total_amount=calculate_total_amount(
+                sale_price_types, fields.get('adult_quantity'), fields.get('child_quantity')
+            ),
+            **fields
+        ))
+        ticket_price_types.append(sale_price_types)
+
+    seats = {}
+    for ticket in tickets:
+        key = (ticket.ship_id, ticket.ticket_day)
+        seats[key] = seats.get(key, 0) + (ticket.adult_quantity or 0) + (ticket.child_quantity or 0)
+    schedules = {ticket.ship_id: ticket.ship for ticket in tickets}
+    versions = {}
+    for schedule_id, ticket_day in sorted(seats):
+        versions[schedule_id, ticket_day] = reserve_seats(
+            schedules[schedule_id], ticket_day, seats[schedule_id, ticket_day]
+        )
+    for ticket in tickets:
+        ticket.manifest_version = versions[ticket.ship_id, ticket.ticket_day]
+
+    Tickets.objects.bulk_create(tickets)
+
+    through = Tickets.price_types.through
+    through.objects.bulk_create([
+        through(tickets_id=ticket.pk, pricetypes_id=price_type.pk)
+        for ticket, sale_price_types in zip(tickets, ticket_price_types)
+        for price_type in sale_price_types
+    ])
+    apply_sales_delta(
+        operator,
+        sum(ticket.adult_quantity or 0 for ticket in tickets),
+        sum(ticket.child_quantity or 0 for ticket in tickets),
+        sum(ticket.total_amount for ticket in tickets),
+    )
+    apply_rollup_delta(tickets)
+    index_tickets(tickets)
+    bump_analytics_days(ticket.ticket_day for ticket in tickets)
+    return tickets
+
+
+@transaction.atomic
+def recalculate_ticket(ticket, previous_departure=None):
+    """
+    Пересчитывает сумму билета после правки в админке. Загрузка рейса билета
+    и рейса до правки (previous_departure — пара (ID расписания, день)) пересчитывается по билетам.
+    """
+    price_types = ticket.price_types.select_related('price')
+    ticket.total_amount = calculate_total_amount(price_types, ticket.adult_quantity, ticket.child_quantity)
+    departures = {(ticket.ship_id, ticket.ticket_day)}
+    if previous_departure is not None:
+        departures.add(previous_departure)
+    versions = {departure: rebuild_departure_ledger(*departure) for departure in sorted(departures)}
+    ticket.manifest_version = versions[ticket.ship_id, ticket.ticket_day]
+    Tickets.objects.filter(pk=ticket.pk).update(
+        total_amount=ticket.total_amount, check_rendered_at=None, manifest_version=ticket.manifest_version
+    )
+    rebuild_sales_report(ticket.operator)
+    rebuild_sales_rollups(ticket.operator.operator_id, ticket.operator.create_data)
+    forget_ticket(ticket.pk)
+    bump_analytics_days([ticket.ticket_day])
+    return ticket
+
+
+@transaction.atomic
+def delete_tickets(queryset):
+    """Удаляет билеты и пересчитывает загрузку их рейсов, отчеты смен и сводки."""
+    tickets = list(queryset.select_related('operator'))
+    Tickets.objects.filter(pk__in=[ticket.pk for ticket in tickets]).delete()
+    for departure in sorted({(ticket.ship_id, ticket.ticket_day) for ticket in tickets}):
+        rebuild_departure_ledger(*departure)
+    for points_sale in {ticket.operator for ticket in tickets}:
+        rebuild_sales_report(points_sale)
+        rebuild_sales_rollups(points_sale.operator_id, points_sale.create_data)
+    for ticket in tickets:
+        forget_ticket(ticket.pk)
+    bump_analytics_days(ticket.ticket_day for ticket in tickets)
+    return len(tickets)
+
+
+@transaction.atomic
+def return_ticket(ticket):
+    ticket = Tickets.objects.select_for_update().select_related('operator', 'ship').get(pk=ticket.pk)
+    if ticket.ticket_return:
+        raise ValidationError({'Сообщение': 'Билет уже возвращен.'})
+    if ticket.ticket_verified or is_marked_used(ticket.pk):
+        raise ValidationError({'Сообщение': 'Билет уже использован и не может быть возвращен.'})
+    ticket.ticket_return = True
+    ticket.manifest_version = release_seats(
+        ticket.ship_id, ticket.ticket_day, (ticket.adult_quantity or 0) + (ticket.child_quantity or 0)
+    )
+    Tickets.objects.filter(pk=ticket.pk).update(ticket_return=True, manifest_version=ticket.manifest_version)
+    forget_ticket(ticket.pk)
+    apply_sales_delta(
+        ticket.operator, -(ticket.adult_quantity or 0), -(ticket.child_quantity or 0), -ticket.total_amount
+    )
+    apply_rollup_delta([ticket], sign=-1)
+    bump_analytics_days([ticket.ticket_day])
+    return ticket
+
+
+def is_ticket_expired(ticket_day, start_time):
+    now = timezone.localtime()
+    return ticket_day < now.date() or (ticket_day == now.date() and start_time <= now.time())
@@ -0,0 +1,60 @@
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def _names(value):
+    return frozenset(name.strip() for name in value.split(',') if name.strip())
+
+
+def requested_shape(request):
+    """
+    Форма ответа из ?fields= и ?expand= для GET: (поля, раскрываемые связи).
+    None означает, что параметр не передан и ограничения нет.
+    """
+    if request is None or request.method != 'GET':
+        return None, None
+    params = request.query_params
+    fields = _names(params[FIELDS_PARAM]) if FIELDS_PARAM in params else None
+    expand = _names(params[EXPAND_PARAM]) if EXPAND_PARAM in params else None
+    return fields, expand
+
+
+def collapse(field):
+    """Вложенный сериализатор заменяется первичными ключами: связь не читается из базы."""
+    if isinstance(field, serializers.ListSerializer):
+        return serializers.PrimaryKeyRelatedField(many=True, read_only=True, source=field.source)
+    return serializers.PrimaryKeyRelatedField(read_only=True, source=field.source)
+
+
+class SparseFieldsMixin:
+    """
+    Сериализатор верхнего уровня оставляет только поля из ?fields=. Если передан
+    ?expand=, раскрываются только перечисленные вложенные связи, остальные
+    отдаются первичными ключами. Без параметров ответ прежний.
+    Форму можно передать и явно через context['sparse_fields'].
+    """
+
+    @property
+    def is_root(self):
+        parent = self.parent
+        return parent is None or (isinstance(parent, serializers.ListSerializer) and parent.parent is None)
+
+    def get_sparse_shape(self):
+        if 'sparse_fields' in self.context:
+            return self.context['sparse_fields']
+        return requested_shape(self.context.get('request'))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.is_root:
+            return fields
+        only, expand = self.get_sparse_shape()
+        if only is not None:
+            fields = {name: field for name, field in fields.items() if name in only or field.write_only}
+        if expand is not None:
+            for name, field in fields.items():
+                if isinstance(field, serializers.BaseSerializer) and name not in expand:
+                    fields[name] = collapse(field)
+        return fields
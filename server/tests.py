@@ -0,0 +1,241 @@
+import threading
+import time as timer
+from datetime import time, timedelta
+
+from django.core.cache import cache
+from django.core.signing import TimestampSigner
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from server import views
+from server.authentication import TOKEN_SALT, issue_auth_token
+from server.gate_index import _timeout, get_gate_entry
+from server.management.commands.benchmark import seed_lists
+from server.models import (
+    User, Price, PriceTypes, Berths, Ship, ShipSchedule, LandingPlaces, PointsSale, DepartureCapacity, Tickets,
+    SalesRollup
+)
+from server.services import issue_ticket
+
+
+def create_departure(restrictions=20):
+    """Оператор с открытой сменой, типы цен и рейс на сегодня."""
+    operator = User.objects.create_user('operator', 'password', user_type='Оператор', is_active=True)
+    area = LandingPlaces.objects.create(address='Набережная', currently_working=True)
+    points_sale = PointsSale.objects.create(operator=operator)
+    points_sale.landing_places.add(area)
+    schedule = ShipSchedule.objects.create(
+        ship=Ship.objects.create(vessel_name='Восход', restrictions=restrictions),
+        berths=Berths.objects.create(berths='Причал 1'),
+        start_time=time(23, 59),
+        end_time=time(23, 59, 30),
+    )
+    adult = PriceTypes.objects.create(client_type='Взрослый', price=Price.objects.create(price=500))
+    child = PriceTypes.objects.create(client_type='Ребенок', price=Price.objects.create(price=200))
+    return operator, points_sale, schedule, area, [adult, child]
+
+
+class ConcurrentSalesTests(TransactionTestCase):
+    threads = 8
+    sales_per_thread = 6
+    capacity = 10
+
+    def test_parallel_sales_never_exceed_capacity(self):
+        _, points_sale, schedule, area, price_types = create_departure(self.capacity)
+        issued, rejected = [], []
+        start = threading.Barrier(self.threads)
+
+        def sell():
+            start.wait()
+            try:
+                for _ in range(self.sales_per_thread):
+                    while True:
+                        try:
+                            ticket = issue_ticket(
+                                points_sale, price_types, ship=schedule, area=area,
+                                ticket_day=timezone.now().date(), adult_quantity=1, child_quantity=1, bought=True
+                            )
+                        except OperationalError:
+                            # SQLite в общей памяти не ждет блокировку, поэтому продажа повторяется.
+                            timer.sleep(0.001)
+                            continue
+                        except ValidationError:
+                            rejected.append(2)
+                        else:
+                            issued.append(ticket.adult_quantity + ticket.child_quantity)
+                        break
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=sell) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        ledger = DepartureCapacity.objects.get(schedule=schedule, ticket_day=timezone.now().date())
+        self.assertLessEqual(ledger.sold, self.capacity)
+        self.assertEqual(ledger.sold, sum(issued))
+        self.assertEqual(ledger.sold, self.capacity)
+        self.assertEqual(Tickets.objects.filter(ship=schedule).count(), len(issued))
+        self.assertEqual(len(issued) + len(rejected), self.threads * self.sales_per_thread)
+
+
+class TicketIssueQueriesTests(TestCase):
+    def setUp(self):
+        operator, _, self.schedule, self.area, self.price_types = create_departure()
+        self.client = APIClient()
+        self.client.force_authenticate(operator)
+
+    def sell(self, **fields):
+        response = self.client.post('/ticket/create/', {
+            'ship': self.schedule.pk,
+            'area': self.area.pk,
+            'price_types': [price_type.pk for price_type in self.price_types],
+            'ticket_day': str(timezone.now().date()),
+            'adult_quantity': 2,
+            'child_quantity': 1,
+            'bought': True,
+            **fields,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_first_sale_queries(self):
+        # Первая продажа за день создает счетчик мест и строки сводок.
+        with self.assertNumQueries(30):
+            self.sell()
+
+    def test_repeat_sale_queries(self):
+        self.sell()
+        with self.assertNumQueries(18):
+            self.sell()
+
+    def test_monthly_totals_in_reports(self):
+        self.sell()
+        self.sell(area=None)
+        today = timezone.now().date()
+        url = '/sales/report/list/results/day/'
+        response = self.client.get(url, {'month': today.month, 'year': today.year})
+        totals = response.data['results'][0]['total_monthly_sales']
+        self.assertEqual((totals['total_adult_quantity'], totals['total_child_quantity']), (4, 2))
+        self.assertEqual(self.client.get(url, {'month': 'abc', 'year': today.year}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'month': 13, 'year': today.year}).status_code, 400)
+
+    def test_sale_without_area(self):
+        self.sell()
+        self.sell(area=None)
+        self.sell(area=None)
+        rollups = SalesRollup.objects.filter(period='День')
+        self.assertEqual(rollups.get(area=self.area).tickets_count, 1)
+        without_area = rollups.get(area__isnull=True)
+        self.assertEqual(without_area.tickets_count, 2)
+        self.assertEqual(without_area.adult_quantity, 4)
+
+
+class ListQueriesTests(TestCase):
+    """Число запросов на страницу списка не зависит от числа строк."""
+    cases = (
+        (views.TicketsList, {}, 2),
+        (views.PointsSaleList, {}, 2),
+        (views.ShipScheduleGetAll, {}, 1),
+        (views.SalesReportListResultsDay, {}, 2),
+        (views.SalesReportListResultsDay, {'month': 'month', 'year': 'year'}, 3),
+        (views.TicketsList, {'fields': 'id,ship,area,total_amount', 'expand': ''}, 1),
+        (views.TicketsList, {'fields': 'id,ship,total_amount', 'expand': 'ship'}, 1),
+        (views.PointsSaleList, {'expand': 'landing_places'}, 2),
+        (views.SalesReportListResultsDay, {'fields': 'id,operator,total_amount_report', 'expand': ''}, 1),
+        (views.SalesReportListResultsDay, {'fields': 'id,total_amount_report', 'month': 'month', 'year': 'year'}, 2),
+    )
+
+    def test_queries_per_page(self):
+        user = User.objects.create(username='operator', user_type='Оператор')
+        today = timezone.now().date()
+        seeded = 0
+        for rows in (3, 20):
+            seed_lists(user, rows - seeded)
+            seeded = rows
+            for view, params, budget in self.cases:
+                query = {key: getattr(today, value, value) for key, value in params.items()}
+                with self.subTest(view=view.__name__, rows=rows, **params):
+                    request = APIRequestFactory().get('/', dict(query, page_size=rows))
+                    force_authenticate(request, user=user)
+                    cache.clear()
+                    with self.assertNumQueries(budget):
+                        response = view.as_view()(request).render()
+                    self.assertEqual(len(response.data['results']), rows)
+
+
+class AuthTokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.operator = User.objects.create_user('operator', 'password', user_type='Оператор', is_active=True)
+        response = APIClient().post('/operator/authorization/', {'username': 'operator', 'password': 'password'})
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["Токен доступа"]}')
+
+    def test_token_survives_login(self):
+        self.assertEqual(self.client.get('/ticket/list/').status_code, 200)
+
+    def test_logout_revokes_token(self):
+        self.assertEqual(self.client.post('/operator/logout/').status_code, 200)
+        self.assertEqual(self.client.get('/ticket/list/').status_code, 401)
+        # Другой процесс без записи в кэше читает поколение из базы.
+        cache.clear()
+        self.assertEqual(self.client.get('/ticket/list/').status_code, 401)
+
+    def test_password_change_revokes_token(self):
+        response = self.client.put('/operator/change/password/', {'old_password': 'password', 'new_password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/ticket/list/').status_code, 401)
+
+    def test_role_change_revokes_token(self):
+        self.operator.user_type = 'Судоводитель'
+        self.operator.save()
+        self.assertEqual(self.client.get('/ticket/list/').status_code, 401)
+
+    def test_token_survives_cache_loss(self):
+        cache.clear()
+        self.assertEqual(self.client.get('/ticket/list/').status_code, 200)
+
+    def test_token_without_generation_is_rejected(self):
+        claims = TimestampSigner(salt=TOKEN_SALT).unsign_object(issue_auth_token(self.operator))
+        del claims['gen']
+        token = TimestampSigner(salt=TOKEN_SALT).sign_object(claims, compress=True)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(self.client.get('/ticket/list/').status_code, 401)
+
+
+class GateIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        operator, points_sale, schedule, area, price_types = create_departure()
+        self.ticket = issue_ticket(
+            points_sale, price_types, ship=schedule, area=area,
+            ticket_day=timezone.now().date(), adult_quantity=1, child_quantity=0, bought=True
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='captain', user_type='Судоводитель'))
+
+    def verify(self):
+        response = self.client.post('/tickets/verification/batch/', {'ids': [self.ticket.pk]}, format='json')
+        return response.data['results'][0]['ticket_verified']
+
+    @override_settings(GATE_INDEX_ENABLED=False)
+    def test_without_shared_cache_checks_database(self):
+        self.assertTrue(self.verify())
+        self.ticket.refresh_from_db()
+        self.assertTrue(self.ticket.ticket_verified)
+        self.assertFalse(self.verify())
+        Tickets.objects.filter(pk=self.ticket.pk).update(ticket_verified=False, ticket_return=True)
+        self.assertTrue(get_gate_entry(self.ticket.pk).returned)
+        self.assertFalse(self.verify())
+
+    @override_settings(GATE_INDEX_ENABLED=True)
+    def test_entries_expire_with_departure_day(self):
+        today = timezone.localdate()
+        self.assertLessEqual(_timeout(today), 24 * 60 * 60)
+        self.assertLessEqual(_timeout(today - timedelta(days=1)), 0)
+        get_gate_entry(self.ticket.pk)
+        self.assertIsNotNone(cache.get(f'gate:ticket:{self.ticket.pk}'))
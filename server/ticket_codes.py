@@ -0,0 +1,59 @@
+import base64
+import hmac
+import struct
+from collections import namedtuple
+from datetime import date, time, timedelta
+
+from django.core.signing import BadSignature
+from django.utils.crypto import salted_hmac
+
+CODE_VERSION = 1
+CODE_SALT = 'server.ticket_codes'
+EPOCH = date(2020, 1, 1)
+SIGNATURE_LENGTH = 10
+PAYLOAD = struct.Struct('>BIIHH')
+
+TicketCode = namedtuple('TicketCode', ('ticket_id', 'schedule_id', 'ticket_day', 'start_time'))
+
+
+def _signature(payload):
+    return salted_hmac(CODE_SALT, payload, algorithm='sha256').digest()[:SIGNATURE_LENGTH]
+
+
+def encode_ticket_code(ticket):
+    """
+    Упаковывает id билета, рейс, день и время отправления в 23 байта с HMAC
+    и кодирует в base32: такие символы QR пишет в алфавитно-цифровом режиме.
+    """
+    start_time = ticket.ship.start_time
+    payload = PAYLOAD.pack(
+        CODE_VERSION,
+        ticket.pk,
+        ticket.ship_id,
+        (ticket.ticket_day - EPOCH).days,
+        start_time.hour * 60 + start_time.minute,
+    )
+    return base64.b32encode(payload + _signature(payload)).decode().rstrip('=')
+
+
+def decode_ticket_code(code):
+    """Проверяет подпись кода без обращения к базе. Бросает BadSignature."""
+    code = code.strip().upper()
+    try:
+        raw = base64.b32decode(code + '=' * (-len(code) % 8))
+    except (ValueError, TypeError):
+        raise BadSignature('Некорректный код билета')
+    if len(raw) != PAYLOAD.size + SIGNATURE_LENGTH:
+        raise BadSignature('Некорректный код билета')
+    payload, signature = raw[:PAYLOAD.size], raw[PAYLOAD.size:]
+    if not hmac.compare_digest(signature, _signature(payload)):
+        raise BadSignature('Подпись кода билета не совпадает')
+    version, ticket_id, schedule_id, day_offset, start_minutes = PAYLOAD.unpack(payload)
+    if version != CODE_VERSION:
+        raise BadSignature('Неизвестная версия кода билета')
+    return TicketCode(
+        ticket_id,
+        schedule_id,
+        EPOCH + timedelta(days=day_offset),
+        time(start_minutes // 60, start_minutes % 60),
+    )
@@ -17,8 +17,13 @@ urlpatterns = [
     path('price_type/update/delete/<int:pk>/', views.PriceTypesUpdateDelete.as_view()),
 
     path('ticket/create/', views.TicketsCreate.as_view()),
+    path('ticket/bulk_create/', views.TicketsBulkCreate.as_view()),
     path('ticket/list/', views.TicketsList.as_view()),
+    path('ticket/<int:pk>/receipt/', views.TicketReceipt.as_view()),
+    path('ticket/<int:pk>/return/', views.TicketReturn.as_view()),
     path('tickets/verification/', views.TicketView.as_view()),
+    path('tickets/verification/batch/', views.TicketBatchVerification.as_view()),
+    path('tickets/manifest/', views.TicketManifest.as_view()),
 
     path('landing/places/create/list/', views.LandingPlacesCreateList.as_view()),
     path('landing/places/update/delete/<int:pk>/', views.LandingPlacesUpdateDelete.as_view()),
@@ -36,6 +41,8 @@ urlpatterns = [
     path('ship/schedule/update/delete/<int:pk>/', views.ShipScheduleUpdateDelete.as_view()),
 
     path('sales/report/list/results/day/', views.SalesReportListResultsDay.as_view()),
+    path('export/<str:name>/', views.DataExport.as_view()),
+    path('analytics/departures/', views.DepartureAnalytics.as_view()),
 
     path('api/v1/user/create/', views.EvotorUsersCreate.as_view()),
     path('installation/event/', views.EvotorUsersDelete.as_view()),
@@ -1,8 +1,25 @@
 import random
 import string
+import time
+
+from django.core.cache import cache
 
 
 def generate_token():
     letters_and_digits = string.ascii_letters + string.digits
     token = ''.join(random.choice(letters_and_digits) for _ in range(32))
     return token
+
+
+def new_version():
+    # Счетчик начинается со времени создания: после вытеснения из кэша старые версии не повторятся.
+    return int(time.time() * 1000)
+
+
+def bump_version(key):
+    """Увеличивает счетчик версии в кэше, создавая его при отсутствии."""
+    if not cache.add(key, new_version(), None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), None)
@@ -1,11 +1,15 @@
-from datetime import datetime
-
 import requests
+from django.core.signing import BadSignature
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
 from .filters import UserFilter
 from .permissions import CreateUserPermission, IsSudovoditel, IsOperator, AdminOnlyPermission
 from rest_framework import generics, permissions, mixins
 from django.contrib.auth import authenticate, login, logout
+from django.db.models import Prefetch
 from rest_framework.views import APIView
 from rest_framework import status
 import logging
@@ -19,8 +23,23 @@ from .serializers import (
     TicketsCreateSerializer, TicketsListSerializer, LandingPlacesSerializer, PointsSaleCreateSerializer,
     PointsSaleSerializer, PointsSaleEndStatus, ShipAllSerializer, ShipScheduleSerializer, ShipScheduleGetAllSerializer,
     TicketSerializer, SalesReportGETSerializer, EvotorUsersSerializer, EvotorTokenSerializer, ShopsSerializer,
-    EvotorOperatorSerializer, TerminalSerializer, ProductSerializer
+    EvotorOperatorSerializer, TerminalSerializer, ProductSerializer, ManifestQuerySerializer,
+    OfflineVerificationSerializer, TicketBatchVerificationSerializer, ExportQuerySerializer,
+    AnalyticsQuerySerializer, SalesReportQuerySerializer
+)
+from .receipts import (
+    prewarm_checks, get_receipt, is_receipt_current, receipt_encoding, receipt_etag, RECEIPT_OUTPUTS
 )
+from .gate_index import get_gate_entry, get_gate_entries, claim_ticket, mark_used, remember_used
+from .manifest import build_manifest, mark_tickets_verified
+from .exports import EXPORTS, EXPORT_OUTPUTS, stream_export
+from .analytics import get_departure_analytics
+from .authentication import issue_auth_token, revoke_auth_tokens
+from .mixins import EagerLoadingMixin, ReferenceCacheMixin, ValuesListMixin, apply_eager_loading
+from .pagination import KeysetPagination
+from .sparse_fields import requested_shape
+from .services import get_monthly_totals, return_ticket, is_ticket_expired
+from .ticket_codes import decode_ticket_code
 from .utils import generate_token
 
 logger = logging.getLogger(__name__)
@@ -30,17 +49,13 @@ class OperatorsList(generics.ListAPIView):
     serializer_class = UserLoginSerializer
     permission_classes = [AdminOnlyPermission]
     filterset_class = UserFilter
+    pagination_class = KeysetPagination
+    keyset_ordering = ('id',)
 
     def get_queryset(self):
         queryset = User.objects.exclude(is_superuser=True)
         return queryset
 
-    def list(self, request, *args, **kwargs):
-        response = super().list(request, *args, **kwargs)
-        data = {'сообщение': 'Список сотрудников'}
-        response.data.append(data)
-        return response
-
 
 class OperatorsDetailUpdateDelete(generics.RetrieveUpdateDestroyAPIView):
     queryset = User.objects.all()
@@ -90,12 +105,14 @@ class OperatorAuthorization(APIView):
             user_data = {
                 'username': operator.username,
             }
+            access_token = issue_auth_token(operator, points_sale)
             evotor_token = EvotorToken.objects.filter(token=request.data.get('token')).first()
             if evotor_token:
                 response_data = {
                     'Сообщение': 'Вы успешно вошли в свой аккаунт!',
                     'Пользователь': user_data,
-                    'Токен': evotor_token.token
+                    'Токен': evotor_token.token,
+                    'Токен доступа': access_token
                 }
                 headers = request.META
 
@@ -105,7 +122,8 @@ class OperatorAuthorization(APIView):
             else:
                 response_data = {
                     'Сообщение': 'Токен не найден!',
-                    'Пользователь': user_data
+                    'Пользователь': user_data,
+                    'Токен доступа': access_token
                 }
 
                 logger.debug(f"Returning response data: {response_data}")
@@ -128,6 +146,7 @@ class OperatorLogout(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request, format=None):
+        revoke_auth_tokens(request.user)
         logout(request)
         return Response({'Сообщение': 'Вы успешно вышли из своего аккаунта.'}, status=status.HTTP_200_OK)
 
@@ -142,14 +161,15 @@ class OperatorChangePassword(APIView):
         if not user.check_password(old_password):
             return Response({'Сообщение': 'Неверный старый пароль.'}, status=status.HTTP_400_BAD_REQUEST)
         user.set_password(new_password)
-        user.save()
+        user.save(update_fields=['password'])
         return Response({'Сообщение': 'Пароль успешно изменен.'}, status=status.HTTP_200_OK)
 
 
-class PriceCreateList(generics.ListCreateAPIView):
+class PriceCreateList(ReferenceCacheMixin, ValuesListMixin, generics.ListCreateAPIView):
     permission_classes = [AdminOnlyPermission]
     queryset = Price.objects.all()
     serializer_class = PriceSerializer
+    reference_models = (Price,)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -181,10 +201,11 @@ class PriceUpdateDelete(generics.RetrieveUpdateDestroyAPIView):
         return Response({'Сообщение': 'Цена успешно удалена.'}, status=status.HTTP_204_NO_CONTENT)
 
 
-class PriceTypesCreate(generics.ListCreateAPIView):
+class PriceTypesCreate(ReferenceCacheMixin, ValuesListMixin, generics.ListCreateAPIView):
     serializer_class = PriceTypesSerializer
     queryset = PriceTypes.objects.all()
     permission_classes = [permissions.IsAdminUser]
+    reference_models = (PriceTypes,)
 
     def create(self, request, *args, **kwargs):
         if not request.user.is_authenticated or request.user.user_type != 'Администрация':
@@ -255,19 +276,93 @@ class TicketsCreate(generics.CreateAPIView):
         }
         return Response(response_data, status=status.HTTP_201_CREATED)
 
+    def perform_create(self, serializer):
+        ticket = serializer.save()
+        prewarm_checks([ticket.pk])
+
+
+class TicketsBulkCreate(generics.CreateAPIView):
+    queryset = Tickets.objects.all()
+    permission_classes = [IsOperator]
+    serializer_class = TicketsCreateSerializer
+    max_tickets = 200
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data, many=True, allow_empty=False, max_length=self.max_tickets)
+        serializer.is_valid(raise_exception=True)
+        tickets = serializer.save()
+        ticket_ids = [ticket.pk for ticket in tickets]
+        prewarm_checks(ticket_ids)
+
+        response_data = {
+            "Сообщение": "Билеты куплены",
+            "Билеты": ticket_ids,
+            "Общая сумма": sum(ticket.total_amount for ticket in tickets)
+        }
+        return Response(response_data, status=status.HTTP_201_CREATED)
 
-class TicketsList(generics.ListAPIView):
+
+class TicketReceipt(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, pk):
+        output = request.query_params.get('output', 'png')
+        if output not in RECEIPT_OUTPUTS:
+            return Response({'Сообщение': f'Неизвестный формат чека: {output}.'}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = Tickets.objects.select_related('operator__operator', 'ship__ship', 'ship__berths', 'area')
+        if not (request.user.is_superuser or request.user.user_type == 'Администрация'):
+            queryset = queryset.filter(operator__operator=request.user)
+        ticket = get_object_or_404(queryset, pk=pk)
+
+        encoding = receipt_encoding(output, request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if is_receipt_current(ticket):
+            not_modified = get_conditional_response(
+                request,
+                etag=receipt_etag(ticket, output, encoding),
+                last_modified=int(ticket.check_rendered_at.timestamp())
+            )
+            if not_modified is not None:
+                return not_modified
+
+        response = HttpResponse(get_receipt(ticket, output, encoding), content_type=RECEIPT_OUTPUTS[output][0])
+        response['ETag'] = receipt_etag(ticket, output, encoding)
+        response['Last-Modified'] = http_date(ticket.check_rendered_at.timestamp())
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if encoding:
+            response['Content-Encoding'] = encoding
+        return response
+
+
+class TicketReturn(APIView):
+    permission_classes = [IsOperator]
+
+    def post(self, request, pk):
+        ticket = return_ticket(get_object_or_404(Tickets, pk=pk, operator__operator=request.user))
+        return Response({'Сообщение': 'Билет возвращен.', 'Сумма возврата': ticket.total_amount},
+                        status=status.HTTP_200_OK)
+
+
+class TicketsList(EagerLoadingMixin, generics.ListAPIView):
+    queryset = Tickets.objects.all()
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = TicketsListSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('created_at', 'id')
+    select_related = {'ship': ('ship__ship',), 'area': ('area',)}
+    prefetch_related = {
+        'price_types': (Prefetch('price_types', queryset=PriceTypes.objects.select_related('price')),),
+    }
 
     def get_queryset(self):
-        return Tickets.objects.filter(operator__operator=self.request.user)
+        return super().get_queryset().filter(operator__operator=self.request.user)
 
 
-class LandingPlacesCreateList(generics.ListCreateAPIView):
+class LandingPlacesCreateList(ReferenceCacheMixin, ValuesListMixin, generics.ListCreateAPIView):
     permission_classes = [AdminOnlyPermission]
     serializer_class = LandingPlacesSerializer
     queryset = LandingPlaces.objects.all()
+    reference_models = (LandingPlaces,)
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -279,8 +374,7 @@ class LandingPlacesCreateList(generics.ListCreateAPIView):
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        return Response({'Сообщение': 'Список мест посадки получен успешно.', 'data': serializer.data},
+        return Response({'Сообщение': 'Список мест посадки получен успешно.', 'data': self.list_values(queryset)},
                         status=status.HTTP_200_OK)
 
 
@@ -315,13 +409,18 @@ class PointsSaleCreate(generics.CreateAPIView):
         return Response({'Сообщение': 'Объект успешно создан.'}, status=status.HTTP_201_CREATED, headers=headers)
 
 
-class PointsSaleList(generics.ListAPIView):
+class PointsSaleList(EagerLoadingMixin, generics.ListAPIView):
+    queryset = PointsSale.objects.all()
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = PointsSaleSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('create_data', 'id')
+    select_related = {'operator': ('operator',)}
+    prefetch_related = {'landing_places': ('landing_places',)}
 
     def get_queryset(self):
         operator = self.request.user
-        queryset = PointsSale.objects.filter(operator_id=operator.id)
+        queryset = super().get_queryset().filter(operator_id=operator.id)
 
         day = self.request.query_params.get('day')
         month = self.request.query_params.get('month')
@@ -347,6 +446,7 @@ class PointsSaleUpdate(generics.UpdateAPIView):
             instance.left_at = timezone.now()
             instance.status = 2
             instance.save()
+            revoke_auth_tokens(self.request.user)
             logout(self.request)
             return Response({'Сообщение': 'Смена закрыта и вы вышли из системы.'}, status=status.HTTP_200_OK)
         else:
@@ -359,10 +459,11 @@ class PointsSaleUpdate(generics.UpdateAPIView):
         return obj
 
 
-class ShipAll(generics.ListAPIView):
+class ShipAll(ReferenceCacheMixin, generics.ListAPIView):
     queryset = Ship.objects.all()
     serializer_class = ShipAllSerializer
     permission_classes = [AdminOnlyPermission]
+    reference_models = (Ship,)
 
 
 class ShipCreate(generics.CreateAPIView):
@@ -399,10 +500,14 @@ class ShipScheduleCreate(generics.CreateAPIView):
     serializer_class = ShipScheduleSerializer
 
 
-class ShipScheduleGetAll(generics.ListAPIView):
+class ShipScheduleGetAll(ReferenceCacheMixin, ValuesListMixin, EagerLoadingMixin, generics.ListAPIView):
     queryset = ShipSchedule.objects.all()
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = ShipScheduleGetAllSerializer
+    pagination_class = KeysetPagination
+    keyset_ordering = ('start_time', 'id')
+    select_related = {'ship': ('ship',)}
+    reference_models = (ShipSchedule, Ship)
 
 
 class ShipScheduleUpdateDelete(generics.RetrieveUpdateDestroyAPIView):
@@ -425,41 +530,173 @@ class TicketView(APIView):
     permission_classes = [IsSudovoditel]
 
     def post(self, request):
+        code = request.data.get('qr')
+        if code:
+            try:
+                ticket_code = decode_ticket_code(code)
+            except BadSignature:
+                return Response({'Сообщение': 'QR-код недействителен.'}, status=status.HTTP_400_BAD_REQUEST)
+            parsed_data = {
+                'id': ticket_code.ticket_id,
+                'ship': ticket_code.schedule_id,
+                'ticket_day': ticket_code.ticket_day,
+                'ship_start_time': ticket_code.start_time,
+            }
+            return self.verify(ticket_code.ticket_id, parsed_data)
+
         serializer = TicketSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         parsed_data = serializer.validated_data
-        ticket_verified = parsed_data.get('ticket_verified')
-        if ticket_verified == "True":
-            error_message = "Билет уже использован."
-            return Response({'Сообщение': error_message, 'data': parsed_data}, status=status.HTTP_400_BAD_REQUEST)
-        ticket_day = parsed_data.get('ticket_day')
-        ship_start_time = parsed_data.get('ship_start_time')
-        current_datetime = datetime.now()
-        current_date = current_datetime.date()
-        current_time = current_datetime.time()
-        if ticket_day < current_date or (ticket_day == current_date and ship_start_time <= current_time):
+        return self.verify(parsed_data['id'], parsed_data)
+
+    def verify(self, ticket_id, parsed_data):
+        entry = get_gate_entry(ticket_id)
+        if entry is None:
+            return Response({'Сообщение': 'Билет не найден.'}, status=status.HTTP_404_NOT_FOUND)
+        if is_ticket_expired(entry.ticket_day, entry.start_time):
             parsed_data['ticket_has_expired'] = True
             error_message = "Билет просрочен."
             return Response({'Сообщение': error_message, 'data': parsed_data}, status=status.HTTP_400_BAD_REQUEST)
+        if entry.returned or entry.verified or not mark_used(ticket_id):
+            error_message = "Билет уже использован или возвращен."
+            return Response({'Сообщение': error_message, 'data': parsed_data}, status=status.HTTP_400_BAD_REQUEST)
         parsed_data['ticket_verified'] = True
         message = "Билет проверен и является действующим."
         return Response({'Сообщение': message, 'data': parsed_data}, status=status.HTTP_200_OK)
 
 
+class TicketBatchVerification(APIView):
+    permission_classes = [IsSudovoditel]
+
+    def post(self, request):
+        serializer = TicketBatchVerificationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = []
+        for code in serializer.validated_data.get('qr', []):
+            try:
+                results.append({'qr': code, 'id': decode_ticket_code(code).ticket_id})
+            except BadSignature:
+                results.append({'qr': code, 'id': None, 'Сообщение': 'QR-код недействителен.'})
+        results.extend({'id': ticket_id} for ticket_id in serializer.validated_data.get('ids', []))
+
+        entries = get_gate_entries({result['id'] for result in results if result['id'] is not None})
+        claimed = []
+        for result in results:
+            if 'Сообщение' in result:
+                continue
+            entry = entries.get(result['id'])
+            if entry is None:
+                result['Сообщение'] = 'Билет не найден.'
+            elif is_ticket_expired(entry.ticket_day, entry.start_time):
+                result['ticket_has_expired'] = True
+                result['Сообщение'] = 'Билет просрочен.'
+            elif entry.returned or entry.verified or not claim_ticket(result['id']):
+                result['Сообщение'] = 'Билет уже использован или возвращен.'
+            else:
+                claimed.append(result)
+
+        verified = mark_tickets_verified([result['id'] for result in claimed])
+        remember_used(verified)
+        for result in claimed:
+            if result['id'] in verified:
+                result['ticket_verified'] = True
+                result['Сообщение'] = 'Билет проверен и является действующим.'
+            else:
+                result['Сообщение'] = 'Билет уже использован или возвращен.'
+        for result in results:
+            result.setdefault('ticket_verified', False)
+        return Response({
+            'Сообщение': f'Проверено билетов: {len(verified)} из {len(results)}.',
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+
+class TicketManifest(APIView):
+    permission_classes = [IsSudovoditel]
+
+    def get(self, request):
+        serializer = ManifestQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(build_manifest(
+            serializer.validated_data['ship'],
+            serializer.validated_data['ticket_day'],
+            serializer.validated_data.get('since')
+        ))
+
+    def post(self, request):
+        serializer = OfflineVerificationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ticket_ids, invalid = set(), []
+        for code in serializer.validated_data['qr']:
+            try:
+                ticket_ids.add(decode_ticket_code(code).ticket_id)
+            except BadSignature:
+                invalid.append(code)
+        verified = mark_tickets_verified(ticket_ids)
+        remember_used(verified)
+        return Response({
+            'Сообщение': f'Принято проверок: {len(verified)}.',
+            'verified': sorted(verified),
+            'rejected': sorted(ticket_ids - verified),
+            'invalid': invalid,
+        }, status=status.HTTP_200_OK)
+
+
 class SalesReportListResultsDay(APIView):
     serializer_class = SalesReportGETSerializer
     permission_classes = [permissions.IsAuthenticated]
+    select_related = {'operator': ('operator__operator',)}
+    prefetch_related = {'operator': ('operator__landing_places',)}
 
     def get(self, request):
-        queryset = SalesReport.objects.all()
-        filters = {
-            'date': request.query_params.get('date'),
-            'month': request.query_params.get('month'),
-            'year': request.query_params.get('year')
-        }
-        queryset = self.serializer_class().filter_reports(queryset, filters)
-        serializer = self.serializer_class(queryset, many=True, context={'request': request})
-        return Response(serializer.data)
+        filters = SalesReportQuerySerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        month, year = filters.validated_data.get('month'), filters.validated_data.get('year')
+        queryset = apply_eager_loading(
+            SalesReport.objects.all(), self.select_related, self.prefetch_related, *requested_shape(request)
+        )
+        queryset = self.serializer_class().filter_reports(queryset, filters.validated_data)
+        paginator = KeysetPagination(ordering=('report_date', 'id'))
+        page = paginator.paginate_queryset(queryset, request, self)
+        context = {'request': request}
+        if month and year:
+            context['monthly_totals'] = get_monthly_totals(year, month, {report.operator_id for report in page})
+        serializer = self.serializer_class(page, many=True, context=context)
+        return paginator.get_paginated_response(serializer.data)
+
+
+class DepartureAnalytics(APIView):
+    permission_classes = [AdminOnlyPermission]
+
+    def get(self, request):
+        serializer = AnalyticsQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(dict(
+            serializer.validated_data,
+            results=get_departure_analytics(**serializer.validated_data)
+        ), status=status.HTTP_200_OK)
+
+
+class DataExport(APIView):
+    permission_classes = [AdminOnlyPermission]
+
+    def get(self, request, name):
+        if name not in EXPORTS:
+            return Response({'Сообщение': f'Неизвестная выгрузка: {name}.'}, status=status.HTTP_404_NOT_FOUND)
+        serializer = ExportQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        output = serializer.validated_data['output']
+        response = StreamingHttpResponse(
+            stream_export(
+                name,
+                output,
+                serializer.validated_data.get('date_from'),
+                serializer.validated_data.get('date_to')
+            ),
+            content_type=EXPORT_OUTPUTS[output]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{name}_{timezone.localdate()}.{output}"'
+        return response
 
 
 class EvotorUsersCreate(generics.ListCreateAPIView):
@@ -761,14 +998,17 @@ class ProductView(APIView):
         headers = {
             'X-Authorization': token
         }
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
+        paginator = KeysetPagination(ordering=('id',))
+        # Товары синхронизируются с Эвотор только при запросе первой страницы.
+        if not request.query_params.get(paginator.cursor_query_param):
+            response = requests.get(url, headers=headers)
+            if response.status_code != 200:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
             json_data = response.json()
 
             for item in json_data:
                 uuid = item['uuid']
                 product, _ = Product.objects.update_or_create(uuid=uuid, defaults=item)
-            serializer = ProductSerializer(Product.objects.all(), many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
-        else:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
+        page = paginator.paginate_queryset(Product.objects.all(), request, self)
+        serializer = ProductSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)